@@ -0,0 +1,163 @@
+import collections
+import datetime
+import threading
+import time
+import serial
+from serial_protocol import JsonLineDecoder, FRAME_ACK, FRAME_READING
+
+ACK_TIMEOUT = 2  # Seconds to wait for an acknowledgement from firmware that sends them
+LEGACY_SETTLE_TIME = 0.5  # Seconds each command is given on firmware that never acknowledges
+MAX_IN_FLIGHT = 4  # Commands written to the Arduino but not yet acknowledged
+ACTUATOR_READ_TIMEOUT = 0.5  # Seconds a read may block waiting for the first byte
+
+
+class ActuatorCommand:
+    """One command byte written to the actuator Arduino and its outcome.
+
+    `outcome` is None while in flight, then "acked", "error" (acknowledged
+    with a non-zero status), "timeout" (no ack from firmware that sends
+    them) or "unacknowledged" (legacy firmware, assumed done once settled).
+    """
+
+    def __init__(self, command, ack=None, timeout=None):
+        self.command = command
+        self.ack = ack or command  # Byte the firmware echoes when it acknowledges
+        self.timeout = timeout  # Seconds allowed for the ack, the driver's default when None
+        self.written_at = None
+        self.finished_at = None
+        self.completed_at = None  # UTC datetime of the ack, for JobQueue.completed_at
+        self.status = None
+        self.outcome = None
+        self._done = threading.Event()
+
+    @property
+    def ok(self):
+        return self.outcome in ("acked", "unacknowledged")
+
+    @property
+    def latency(self):
+        """Seconds from write to acknowledgement, or None while in flight."""
+        return self.finished_at - self.written_at if self.finished_at else None
+
+    def _finish(self, outcome, status=None):
+        self.finished_at = time.monotonic()
+        self.completed_at = datetime.datetime.utcnow()
+        self.outcome = outcome
+        self.status = status
+        self._done.set()
+
+
+class ActuatorDriver:
+    """Sends single-byte commands to the actuator Arduino and matches its acknowledgements.
+
+    A reader thread decodes the port with `decoder`. Acks arrive as binary
+    FRAME_ACK frames or as JSON lines like {"ack": "s", "status": 0}, and
+    each one completes the oldest in-flight command expecting that ack byte.
+    `execute()` pipelines up to `window` commands and yields each result as
+    soon as it is acknowledged or times out, instead of sleeping a fixed
+    delay per command. Until the firmware has shown it sends acks (binary
+    protocol negotiated, or an ack seen), commands run one at a time and
+    are given `settle_time` each, like the old fixed debounce.
+    """
+
+    def __init__(self, serial_conn, decoder=None, window=MAX_IN_FLIGHT, ack_timeout=ACK_TIMEOUT,
+                 settle_time=LEGACY_SETTLE_TIME):
+        self.serial_conn = serial_conn
+        self.decoder = decoder or JsonLineDecoder()
+        self.window = window
+        self.ack_timeout = ack_timeout
+        self.settle_time = settle_time
+        self.acks_supported = self.decoder.name == "binary"
+        self.latencies = collections.deque(maxlen=100)  # Seconds, newest acknowledged commands
+        self._in_flight = collections.deque()
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self.serial_conn.timeout = ACTUATOR_READ_TIMEOUT
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=2):
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout)
+        self._thread = None
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            try:
+                chunk = self.serial_conn.read(self.serial_conn.in_waiting or 1)
+            except serial.SerialException as e:
+                print(f"❌ Error reading actuator serial data: {e}")
+                self._stop_event.wait(1)
+                continue
+            for frame in self.decoder.feed(chunk):
+                if frame.type == FRAME_ACK:
+                    self._acknowledge(frame.payload["command"].encode(), frame.payload["status"])
+                elif frame.type == FRAME_READING and isinstance(frame.payload, dict) and "ack" in frame.payload:
+                    try:
+                        status = int(frame.payload.get("status", 0))
+                    except (TypeError, ValueError):
+                        print(f"⚠️ Ignoring actuator ack with a bad status: {frame.payload!r}")
+                        continue
+                    self._acknowledge(str(frame.payload["ack"]).encode(), status)
+
+    def _acknowledge(self, command, status):
+        with self._lock:
+            self.acks_supported = True
+            pending = next((item for item in self._in_flight if item.ack == command), None)
+            if pending is None:
+                print(f"⚠️ Unexpected actuator ack for {command!r}")
+                return
+            self._in_flight.remove(pending)
+            pending._finish("acked" if status == 0 else "error", status)  # Under the lock, so result() never sees it half done
+        self.latencies.append(pending.latency)
+        print(f"⏱️ Actuator {command!r} acknowledged in {pending.latency * 1000:.0f} ms")
+
+    def send(self, command, ack=None, timeout=None):
+        """Writes one command without waiting. Returns its ActuatorCommand."""
+        pending = ActuatorCommand(command, ack, timeout)
+        with self._write_lock:
+            with self._lock:
+                self._in_flight.append(pending)
+            pending.written_at = time.monotonic()
+            self.serial_conn.write(command)
+        return pending
+
+    def result(self, pending):
+        """Waits for `pending` to be acknowledged, or gives up after the ack timeout (settle time on legacy firmware)."""
+        limit = (pending.timeout or self.ack_timeout) if self.acks_supported else self.settle_time
+        pending._done.wait(max(0, pending.written_at + limit - time.monotonic()))
+        with self._lock:
+            if pending.outcome is not None:
+                return pending
+            self._in_flight.remove(pending)
+        if self.acks_supported:
+            print(f"⚠️ Actuator {pending.command!r} not acknowledged within {limit}s")
+            pending._finish("timeout")
+        else:
+            pending._finish("unacknowledged")
+        return pending
+
+    def execute(self, commands):
+        """Runs registry commands (see commands.py) in order, keeping up to `window` in flight.
+
+        Yields each ActuatorCommand as it finishes.
+        """
+        pending = collections.deque()
+        for command in commands:
+            if len(pending) >= (self.window if self.acks_supported else 1):
+                yield self.result(pending.popleft())
+            pending.append(self.send(command.payload, command.ack, command.timeout))
+        while pending:
+            yield self.result(pending.popleft())
+
+    def run(self, command, ack=None, timeout=None):
+        """Sends one command and waits for its outcome."""
+        return self.result(self.send(command, ack, timeout))
@@ -0,0 +1,423 @@
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+import aiohttp
+from aiohttp import web
+from repository.database import db_session
+from repository.jobs import update_job, update_job_statuses, MAX_PAGE_SIZE
+from outbox import Delivery
+from http_client import POOL_MAXSIZE, DEFAULT_TIMEOUT
+from timeseries import parse_history_query
+from device_api import (ApiError, announce_delays, resolve_devices, get_device, device_info, parse_command,
+                        group_commands, queued_response, parse_job_query, job_page, parse_stream_query,
+                        pending_jobs_after, job_event, parse_job_update, parse_job_updates,
+                        JOB_STREAM_KEEPALIVE, JOB_STREAM_HEADERS)
+
+TEST_READING_INTERVAL = 5  # Seconds between generated readings in testing mode
+AGGREGATION_POLL_INTERVAL = 1  # Seconds between passes of new serial readings through the aggregator
+MAX_CAMERA_VIEWERS = 8  # Concurrent /camera streams, each holding one thread of the camera executor
+
+
+def _etag_matches(request, etag):
+    if_none_match = request.headers.get("If-None-Match", "")
+    return etag in [tag.strip() for tag in if_none_match.split(",")]
+
+
+async def _read_json(request):
+    """The request's JSON body, or None when it is missing or invalid (answered with a 400 by the parsers)."""
+    try:
+        return await request.json()
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        return None
+
+
+@web.middleware
+async def api_errors(request, handler):
+    try:
+        return await handler(request)
+    except ApiError as e:
+        return web.json_response(e.body(), status=e.status)
+
+
+class AsyncDeviceRuntime:
+    """Runs the device service for a DeviceGateway on a single asyncio event loop.
+
+    This replaces the Flask dev server and the per-device worker threads:
+    - HTTP routes are served by aiohttp, optionally next to the WebRTC /offer endpoint.
+    - Terminal calls share one keep-alive aiohttp ClientSession.
+    - Sensor ports are watched with `loop.add_reader`, falling back to the
+      default executor for ports without a file descriptor.
+    - Routes push device ids onto an asyncio.Queue that drives job dispatch.
+    SQLAlchemy, the telemetry outbox and camera setup stay synchronous and run
+    in the default executor; MJPEG streams get their own executor. Request validation and response bodies come
+    from device_api, shared with the Flask routes.
+    """
+
+    def __init__(self, gateway, upload_interval, sweep_interval, claim_batch, cohost_webrtc=True,
+                 get_camera=None, camera_state=None, boot_time=None):
+        self.gateway = gateway
+        self.get_camera = get_camera  # Returns the device's LazyCamera, see device_emulator.get_camera
+        self.camera_state = camera_state or (lambda: "idle")
+        self.boot_time = boot_time if boot_time is not None else time.monotonic()
+        self.upload_interval = upload_interval
+        self.sweep_interval = sweep_interval
+        self.claim_batch = claim_batch
+        self.cohost_webrtc = cohost_webrtc
+        self.http = None
+        self.job_queue = None
+        self.tasks = set()
+        self.sensor_tasks = {}  # device_id -> upload task while the device is registered
+        # Each /camera viewer holds a thread for as long as it watches, so streams
+        # never starve the default executor that DB and serial work runs on
+        self.camera_executor = ThreadPoolExecutor(MAX_CAMERA_VIEWERS, thread_name_prefix="mjpeg")
+        self.camera_viewers = 0
+
+    # ========== APP LIFECYCLE ==========
+    def create_app(self):
+        app = web.Application(middlewares=[api_errors])
+        app.add_routes([
+            web.get("/", self.home),
+            web.post("/register", self.register_device),
+            web.post("/unregister", self.unregister_device),
+            web.post("/send_command", self.send_command),
+            web.post("/send_commands", self.send_commands),
+            web.get("/device_info", self.get_device_info),
+            web.get("/get-jobs", self.get_jobs),
+            web.get("/jobs/stream", self.stream_jobs),
+            web.put("/update-job/{job_id:\\d+}", self.update_job),
+            web.put("/update-jobs", self.update_jobs),
+            web.get("/sensor-history", self.sensor_history),
+            web.get("/camera", self.video_feed),
+        ])
+        if self.cohost_webrtc:
+            import webrtc_cam
+            from aiohttp_cors import setup as setup_cors, ResourceOptions
+            app.add_routes([web.post("/offer", webrtc_cam.offer)])
+            app.on_shutdown.append(webrtc_cam.on_shutdown)
+            cors = setup_cors(app, defaults={
+                "*": ResourceOptions(allow_credentials=True, expose_headers="*", allow_headers="*"),
+            })
+            for route in list(app.router.routes()):
+                cors.add(route)
+        app.on_startup.append(self.on_startup)
+        app.on_cleanup.append(self.on_cleanup)
+        return app
+
+    async def on_startup(self, app):
+        self.http = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit_per_host=POOL_MAXSIZE),
+            timeout=aiohttp.ClientTimeout(total=DEFAULT_TIMEOUT),
+        )
+        self.job_queue = asyncio.Queue()
+        self.spawn(self.uplink())
+        self.spawn(self.dispatch_jobs())
+        for emulator in self.gateway.devices.values():
+            self.spawn(self.bring_up(emulator))
+
+    async def on_cleanup(self, app):
+        for task in list(self.tasks):
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        loop = asyncio.get_running_loop()
+        for emulator in self.gateway.devices.values():
+            if emulator.serial_conn_1:
+                loop.remove_reader(emulator.serial_conn_1.fileno())
+            emulator.stop()
+        self.camera_executor.shutdown(wait=False, cancel_futures=True)
+        await self.http.close()
+
+    def spawn(self, coroutine):
+        task = asyncio.create_task(coroutine)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return task
+
+    async def run_blocking(self, fn, *args):
+        """Runs blocking (DB or serial) work in the default executor and releases its DB session."""
+        def call():
+            try:
+                return fn(*args)
+            finally:
+                db_session.remove()
+        return await asyncio.get_running_loop().run_in_executor(None, call)
+
+    # ========== TERMINAL AND SERIAL ==========
+    async def bring_up(self, emulator):
+        """Announces a device to the terminal with backoff, then connects and watches its serial ports."""
+        url = f"{emulator.terminal_api_url}/register_device"
+        emulator.state = "announcing"
+        delays = announce_delays()
+        while True:
+            try:
+                async with self.http.post(url, json=emulator.announcement()) as response:
+                    if response.status == 200:
+                        print(f"✅ Announced to terminal: {emulator.device_id}")
+                        break
+                    print(f"⚠️ Failed to announce. HTTP {response.status}: {await response.text()}")
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                print(f"❌ Error announcing to terminal: {e}")
+            await asyncio.sleep(next(delays))
+
+        emulator.state = "connecting"
+        await self.run_blocking(emulator.connect_serial, False)
+        emulator.running = True
+        emulator.state = "ready"
+        emulator.ready.set()
+        if emulator.serial_ingestor:
+            self.watch_serial(emulator)
+        self.signal_jobs(emulator.device_id)  # Run jobs queued while the device was coming up
+
+    def watch_serial(self, emulator):
+        conn = emulator.serial_conn_1
+        try:
+            fd = conn.fileno()
+        except (AttributeError, OSError, ValueError):
+            self.spawn(self.poll_serial(emulator))
+            return
+        asyncio.get_running_loop().add_reader(fd, self.on_serial_readable, emulator)
+
+    def on_serial_readable(self, emulator):
+        conn = emulator.serial_conn_1
+        try:
+            chunk = conn.read(conn.in_waiting or 1)
+        except Exception as e:
+            print(f"❌ Error reading serial data: {e}")
+            asyncio.get_running_loop().remove_reader(conn.fileno())
+            return
+        if chunk:
+            emulator.serial_ingestor.feed(chunk)
+
+    async def poll_serial(self, emulator):
+        """Executor fallback for ports that cannot be watched with add_reader."""
+        conn = emulator.serial_conn_1
+        loop = asyncio.get_running_loop()
+        while True:
+            chunk = await loop.run_in_executor(None, lambda: conn.read(conn.in_waiting or 1))
+            if chunk:
+                emulator.serial_ingestor.feed(chunk)
+
+    async def upload_readings(self, emulator):
+        """Aggregates every new reading while the device is registered, queueing a summary every upload interval."""
+        loop = asyncio.get_running_loop()
+        next_summary = loop.time() + self.upload_interval
+        while True:
+            if emulator.testing:
+                reading = emulator.generate_test_reading()
+                await self.run_blocking(emulator.history.append, time.time(), reading)
+                await self.run_blocking(emulator.forward_to_local_api, reading)
+                await asyncio.sleep(TEST_READING_INTERVAL)
+                continue
+            entries = emulator.serial_ingestor.readings_since(emulator.aggregated_seq) if emulator.serial_ingestor else []
+            if entries:
+                await self.run_blocking(emulator.aggregate_readings, entries)
+            if loop.time() >= next_summary:
+                await self.run_blocking(emulator.report_aggregate, "interval")
+                next_summary = loop.time() + self.upload_interval
+            await asyncio.sleep(AGGREGATION_POLL_INTERVAL)
+
+    async def uplink(self):
+        """Ships the shared telemetry outbox to the terminal with TelemetryOutbox's own batching and retry rules."""
+        outbox = self.gateway.outbox
+        backoff = 0
+        while True:
+            delay = await self.run_blocking(outbox.flush_delay)
+            if delay != 0:
+                await asyncio.sleep(outbox.max_age if delay is None else delay)
+                continue
+
+            rows = await self.run_blocking(outbox.next_batch)
+            if not rows:
+                continue
+            delivery = Delivery(rows)
+            await self.send_readings(delivery)
+            await self.run_blocking(outbox.finish, delivery)
+            if delivery.retry:
+                backoff = await self.run_blocking(outbox.next_backoff, backoff)
+                await asyncio.sleep(backoff)
+            else:
+                backoff = 0
+
+    async def send_readings(self, delivery):
+        """Drives TelemetryOutbox.uploads() for `delivery` over the shared aiohttp session."""
+        uploads = self.gateway.outbox.uploads(delivery)
+        try:
+            url, body, timeout = next(uploads)
+            while True:
+                async with self.http.post(url, json=body, timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+                    url, body, timeout = uploads.send((response.status, await response.text()))
+        except StopIteration:
+            pass
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            print(f"❌ Error sending to terminal: {e}")
+            delivery.retry = True
+
+    # ========== JOBS ==========
+    def signal_jobs(self, device_id):
+        """Wakes the dispatcher for a device and every /jobs/stream listener."""
+        self.job_queue.put_nowait(device_id)
+        self.gateway.job_notifier.notify()
+
+    async def dispatch_jobs(self):
+        """Runs pending jobs for devices signalled on the queue, with a periodic recovery sweep."""
+        for emulator in self.gateway.devices.values():
+            await self.run_blocking(emulator.requeue_interrupted_jobs)
+        while True:
+            try:
+                device_ids = {await asyncio.wait_for(self.job_queue.get(), self.sweep_interval)}
+            except asyncio.TimeoutError:
+                device_ids = set(self.gateway.devices)
+            while not self.job_queue.empty():
+                device_ids.add(self.job_queue.get_nowait())
+
+            for device_id in device_ids:
+                emulator = self.gateway.get(device_id)
+                if emulator is None or not (emulator.running and emulator.is_registered):
+                    continue
+                while await self.run_blocking(emulator.process_pending_jobs) == self.claim_batch:
+                    pass  # A full batch means more jobs may be waiting
+
+    # ========== ROUTES ==========
+    async def home(self, request):
+        return web.Response(text="HELLO THIS IS THE AMAN DEVICE")
+
+    async def register_device(self, request):
+        emulators = resolve_devices(self.gateway, request.query.get("device_id"))
+        if not emulators:
+            return web.json_response({"error": "Unknown device_id"}, status=404)
+        for emulator in emulators:
+            emulator.is_registered = True
+            if emulator.device_id not in self.sensor_tasks:
+                self.sensor_tasks[emulator.device_id] = self.spawn(self.upload_readings(emulator))
+            self.signal_jobs(emulator.device_id)
+        return web.json_response({"status": "success", "message": "Device registered successfully."})
+
+    async def unregister_device(self, request):
+        emulators = resolve_devices(self.gateway, request.query.get("device_id"))
+        if not emulators:
+            return web.json_response({"error": "Unknown device_id"}, status=404)
+        for emulator in emulators:
+            emulator.is_registered = False
+            task = self.sensor_tasks.pop(emulator.device_id, None)
+            if task:
+                task.cancel()
+        return web.json_response({"status": "success", "message": "Device unregistered successfully."})
+
+    async def send_command(self, request):
+        data = parse_command(await _read_json(request))
+        emulator = get_device(self.gateway, data.get("device_id"))
+        response = await self.run_blocking(emulator.send_command, data)
+        self.signal_jobs(emulator.device_id)
+        return web.json_response(response)
+
+    async def send_commands(self, request):
+        batches = group_commands(self.gateway, await _read_json(request))
+        responses = []
+        for emulator, commands in batches.items():
+            responses.append(await self.run_blocking(emulator.send_commands, commands))
+            self.signal_jobs(emulator.device_id)
+        return web.json_response(queued_response(responses, sum(map(len, batches.values()))))
+
+    async def get_device_info(self, request):
+        emulator = get_device(self.gateway, request.query.get("device_id"))
+        return web.json_response(device_info(self.gateway, emulator, self.camera_state(), time.monotonic() - self.boot_time))
+
+    async def get_jobs(self, request):
+        """Same contract as the Flask /get-jobs route: filters, keyset pagination, since and ETag."""
+        filters = parse_job_query(request.query)
+        body, headers = await self.run_blocking(job_page, db_session, filters)
+        if _etag_matches(request, headers["ETag"]):
+            return web.Response(status=304, headers=headers)
+        return web.Response(body=body, content_type="application/json", headers=headers)
+
+    async def stream_jobs(self, request):
+        """Server-sent events stream of pending jobs, same contract as the Flask /jobs/stream route."""
+        query = parse_stream_query(request.query, request.headers)
+        after_id = query["after_id"]
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream", **JOB_STREAM_HEADERS})
+        await response.prepare(request)
+
+        notifier = self.gateway.job_notifier
+        while True:
+            version = notifier.version
+            jobs = await self.run_blocking(pending_jobs_after, db_session, query["device_id"], query["task_names"], after_id)
+            for job in jobs:
+                after_id = job["id"]
+                await response.write(job_event(job).encode())
+            if len(jobs) == MAX_PAGE_SIZE:
+                continue
+            if await notifier.wait_async(version, timeout=JOB_STREAM_KEEPALIVE) == version:
+                await response.write(b": keepalive\n\n")
+
+    async def update_job(self, request):
+        job_id = int(request.match_info["job_id"])
+        data, completed_at = parse_job_update(await _read_json(request))
+        if not await self.run_blocking(update_job, db_session, job_id, data, completed_at):
+            return web.json_response({"message": "Job not found"}, status=404)
+        self.gateway.job_notifier.notify()
+        return web.json_response({"message": "Job updated successfully"})
+
+    async def update_jobs(self, request):
+        updates, completed_at = parse_job_updates(await _read_json(request))
+        not_found = await self.run_blocking(update_job_statuses, db_session, updates, completed_at)
+        self.gateway.job_notifier.notify()
+        return web.json_response({"message": "Jobs updated successfully", "updated": len(updates) - len(not_found), "not_found": not_found})
+
+    async def sensor_history(self, request):
+        emulator = get_device(self.gateway, request.query.get("device_id"))
+        try:
+            metric, start, end, step = parse_history_query(request.query)
+        except ValueError as e:
+            return web.json_response({"error": str(e)}, status=400)
+        history = await self.run_blocking(emulator.history.query, metric, start, end, step)
+        return web.json_response({"device_id": emulator.device_id, **history})
+
+    async def video_feed(self, request):
+        """MJPEG camera stream, same contract as the Flask /camera route.
+
+        Opening the camera and encoding frames block, so the frame generator
+        is driven from a camera executor thread that waits for each write,
+        like the Flask server thread it replaces. Viewers beyond
+        MAX_CAMERA_VIEWERS are answered with 503.
+        """
+        if self.get_camera is None:
+            return web.json_response({"error": "Camera is not available", "camera": "unavailable"}, status=503)
+        camera = await self.run_blocking(self.get_camera)  # Imports OpenCV on first use
+        from camera import StreamSettings
+        try:
+            settings = StreamSettings.from_args(request.query)
+        except ValueError as e:
+            return web.json_response({"error": str(e)}, status=400)
+        if not await self.run_blocking(camera.ensure_open):
+            return web.json_response({"error": "Camera is not available", "camera": camera.state}, status=503)
+        if self.camera_viewers >= MAX_CAMERA_VIEWERS:
+            return web.json_response({"error": "Too many camera viewers", "camera": camera.state}, status=503)
+        self.camera_viewers += 1  # No await since the check, so concurrent requests cannot both pass it
+        try:
+            return await self.stream_frames(request, camera.frames(settings))
+        finally:
+            self.camera_viewers -= 1
+
+    async def stream_frames(self, request, frames):
+        """Writes the MJPEG chunks of `frames` to a streaming response from a camera executor thread."""
+        response = web.StreamResponse(headers={"Content-Type": "multipart/x-mixed-replace; boundary=frame"})
+        await response.prepare(request)
+        loop = asyncio.get_running_loop()
+
+        def pump():
+            try:
+                for chunk in frames:
+                    asyncio.run_coroutine_threadsafe(response.write(chunk), loop).result()
+            finally:
+                frames.close()
+        try:
+            await loop.run_in_executor(self.camera_executor, pump)
+        except ConnectionError:
+            pass  # The viewer went away
+        return response
+
+
+def run_async(gateway, host="0.0.0.0", port=8082, **options):
+    """Serves the device API and all device workers from one asyncio event loop."""
+    runtime = AsyncDeviceRuntime(gateway, **options)
+    web.run_app(runtime.create_app(), host=host, port=port)
@@ -0,0 +1,63 @@
+"""Measures how long the device service's modules take to import.
+
+Each module is imported in a fresh interpreter, so nothing is cached from
+a previous run. The script reports wall time, peak memory and whether
+OpenCV got loaded along the way. Example:
+
+    python bench_startup.py --runs 5 device_emulator camera
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+DEFAULT_MODULES = ["device_emulator", "camera", "cv2"]
+DEFAULT_RUNS = 5
+
+PROBE = """
+import json, resource, sys, time
+started = time.perf_counter()
+__import__(sys.argv[1])
+elapsed = time.perf_counter() - started
+print(json.dumps({
+    "seconds": elapsed,
+    "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    "cv2_loaded": "cv2" in sys.modules,
+}))
+"""
+
+
+def measure(module, env):
+    """Imports `module` in a fresh interpreter and returns the probe's measurements."""
+    result = subprocess.run([sys.executable, "-c", PROBE, module], env=env,
+                            capture_output=True, text=True, timeout=120)
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("modules", nargs="*", default=DEFAULT_MODULES)
+    parser.add_argument("--runs", type=int, default=DEFAULT_RUNS)
+    args = parser.parse_args()
+
+    # The asyncio runtime skips the startup threads, so only the import itself is timed
+    env = dict(os.environ, AMAN_RUNTIME=os.environ.get("AMAN_RUNTIME", "asyncio"))
+    for module in args.modules:
+        try:
+            samples = [measure(module, env) for _ in range(args.runs)]
+        except RuntimeError as e:
+            print(f"❌ {e}")
+            continue
+        seconds = [sample["seconds"] for sample in samples]
+        print(f"{module:20} median {statistics.median(seconds) * 1000:8.1f} ms"
+              f"  min {min(seconds) * 1000:8.1f} ms"
+              f"  peak RSS {max(sample['max_rss_kb'] for sample in samples) / 1024:6.1f} MB"
+              f"  cv2 loaded: {samples[0]['cv2_loaded']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,249 @@
+import threading
+import time
+import cv2
+
+FRAME_WAIT_TIMEOUT = 1  # Seconds a subscriber waits for a new frame before re-checking the broadcaster
+CAMERA_IDLE_TIMEOUT = 60  # Seconds without subscribers before LazyCamera releases the capture device
+
+# MJPEG stream defaults, overridable per client through /camera query parameters
+DEFAULT_JPEG_QUALITY = 80
+MIN_JPEG_QUALITY = 20  # Floor for automatic quality reduction
+MAX_STREAM_FPS = 30
+AUTO_QUALITY_STEP = 10
+AUTO_WRITE_BUDGET = 0.1  # Seconds a frame write may take in auto mode when no fps is requested
+TRUE_VALUES = ("1", "true", "yes", "on")
+
+
+class StreamSettings:
+    """Per-client MJPEG encoding options.
+
+    `quality` is the JPEG quality (1-100), `fps` caps the frame rate by
+    dropping frames, `scale` downsizes each frame (0 < scale <= 1),
+    `grayscale` drops colour, and `auto` lowers quality while the client's
+    socket writes fall behind and raises it again once they catch up.
+    """
+
+    def __init__(self, quality=DEFAULT_JPEG_QUALITY, fps=None, scale=1.0, grayscale=False, auto=False):
+        self.quality = quality
+        self.fps = fps
+        self.scale = scale
+        self.grayscale = grayscale
+        self.auto = auto
+
+    @classmethod
+    def from_args(cls, args):
+        """Builds settings from request query parameters. Raises ValueError on invalid input."""
+        quality = int(args.get("quality", DEFAULT_JPEG_QUALITY))
+        if not 1 <= quality <= 100:
+            raise ValueError("quality must be between 1 and 100")
+        fps = args.get("fps")
+        if fps is not None:
+            fps = float(fps)
+            if not 0 < fps <= MAX_STREAM_FPS:
+                raise ValueError(f"fps must be between 0 and {MAX_STREAM_FPS}")
+        scale = float(args.get("scale", 1.0))
+        if not 0 < scale <= 1:
+            raise ValueError("scale must be greater than 0 and at most 1")
+        grayscale = args.get("gray", "").lower() in TRUE_VALUES
+        auto = args.get("auto", "").lower() in TRUE_VALUES
+        return cls(quality=quality, fps=fps, scale=scale, grayscale=grayscale, auto=auto)
+
+
+class CameraBroadcaster:
+    """Captures from a single `cv2.VideoCapture` and shares each frame with every MJPEG client.
+
+    One capture thread reads and JPEG-encodes every frame exactly once into a
+    shared latest-frame slot and wakes subscribers through a condition
+    variable. Subscribers always pick up the newest frame, so a slow client
+    skips frames instead of stalling the capture or the other viewers.
+    """
+
+    def __init__(self, capture, jpeg_quality=DEFAULT_JPEG_QUALITY):
+        self.capture = capture
+        self.jpeg_quality = jpeg_quality
+        self._condition = threading.Condition()
+        self._frame = None  # Latest raw BGR frame
+        self._jpeg = None  # Latest frame encoded as JPEG bytes at `jpeg_quality`
+        self._seq = 0
+        self._variants = {}  # (quality, scale, grayscale) -> JPEG bytes for the current frame
+        self._variants_seq = 0
+        self._variants_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.running:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=2):
+        self._stop_event.set()
+        with self._condition:
+            self._condition.notify_all()
+        if self._thread:
+            self._thread.join(timeout)
+        self._thread = None
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            success, frame = self.capture.read()
+            if not success:
+                print("⚠️ No frame received from the camera")
+                self._stop_event.wait(0.5)
+                continue
+            success, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+            if not success:
+                continue
+            with self._condition:
+                self._frame = frame
+                self._jpeg = buffer.tobytes()
+                self._seq += 1
+                self._condition.notify_all()
+
+    def wait_for_frame(self, last_seq, timeout=FRAME_WAIT_TIMEOUT):
+        """Blocks until a frame newer than `last_seq` is available.
+
+        Returns (seq, frame, jpeg_bytes), or (last_seq, None, None) if the wait timed out.
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: self._seq != last_seq or self._stop_event.is_set(), timeout)
+            if self._seq == last_seq:
+                return last_seq, None, None
+            return self._seq, self._frame, self._jpeg
+
+    def encode(self, seq, frame, jpeg, quality, scale=1.0, grayscale=False):
+        """Returns the JPEG for `frame` with the given options.
+
+        The shared encode is reused when the options match the broadcaster's,
+        and other variants are cached per frame so clients with identical
+        settings share a single encode.
+        """
+        if quality == self.jpeg_quality and scale == 1.0 and not grayscale:
+            return jpeg
+        key = (quality, scale, grayscale)
+        with self._variants_lock:
+            if self._variants_seq != seq:
+                self._variants = {}
+                self._variants_seq = seq
+            cached = self._variants.get(key)
+            if cached is not None:
+                return cached
+            if scale != 1.0:
+                frame = cv2.resize(frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+            if grayscale:
+                frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            success, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+            if not success:
+                return jpeg
+            self._variants[key] = buffer.tobytes()
+            return self._variants[key]
+
+    def frames(self, settings=None):
+        """Yields multipart MJPEG chunks for one subscriber until the broadcaster stops."""
+        settings = settings or StreamSettings(quality=self.jpeg_quality)
+        quality = settings.quality
+        frame_interval = 1.0 / settings.fps if settings.fps else 0
+        write_budget = frame_interval or AUTO_WRITE_BUDGET
+        last_seq = 0
+        next_due = 0
+        while self.running:
+            delay = next_due - time.monotonic()
+            if delay > 0:
+                # Frames captured while we wait are dropped for this client
+                self._stop_event.wait(delay)
+                continue
+            last_seq, frame, jpeg = self.wait_for_frame(last_seq)
+            if jpeg is None:
+                continue
+            next_due = time.monotonic() + frame_interval
+            data = self.encode(last_seq, frame, jpeg, quality, settings.scale, settings.grayscale)
+
+            # The generator resumes only once the server has written the chunk,
+            # so the time spent in `yield` tracks the client's socket backlog.
+            write_started = time.monotonic()
+            yield (b'--frame\r\n'
+                   b'Content-Type: image/jpeg\r\n\r\n' + data + b'\r\n')
+            if settings.auto:
+                write_time = time.monotonic() - write_started
+                if write_time > write_budget:
+                    quality = max(MIN_JPEG_QUALITY, quality - AUTO_QUALITY_STEP)
+                elif write_time < write_budget / 4:
+                    quality = min(settings.quality, quality + AUTO_QUALITY_STEP)
+
+
+class LazyCamera:
+    """Opens the camera for the first subscriber and releases it once idle.
+
+    `open_capture` is called to open the device and returns an opened
+    `cv2.VideoCapture`, or None when no camera is available. The capture and
+    its `CameraBroadcaster` are torn down after `idle_timeout` seconds
+    without subscribers, so a headless device holds no capture between viewers.
+    """
+
+    def __init__(self, open_capture, idle_timeout=CAMERA_IDLE_TIMEOUT, jpeg_quality=DEFAULT_JPEG_QUALITY):
+        self.open_capture = open_capture
+        self.idle_timeout = idle_timeout
+        self.jpeg_quality = jpeg_quality
+        self.broadcaster = None
+        self.subscribers = 0
+        self.state = "idle"  # idle -> streaming, or unavailable when the last open failed
+        self._lock = threading.RLock()
+        self._idle_timer = None
+
+    def ensure_open(self):
+        """Opens the camera unless it already is. Returns False if no camera is available."""
+        with self._lock:
+            if self.broadcaster is not None:
+                return True
+            capture = self.open_capture()
+            if capture is None:
+                self.state = "unavailable"
+                return False
+            self.broadcaster = CameraBroadcaster(capture, self.jpeg_quality)
+            self.broadcaster.start()
+            self.state = "streaming"
+            if self.subscribers == 0:
+                self._schedule_release()  # In case the caller never subscribes
+            return True
+
+    def frames(self, settings=None):
+        """Yields MJPEG chunks for one subscriber, opening the camera if needed."""
+        with self._lock:
+            self.subscribers += 1
+            self._cancel_release()
+        try:
+            if self.ensure_open():
+                yield from self.broadcaster.frames(settings)
+        finally:
+            with self._lock:
+                self.subscribers -= 1
+                if self.subscribers == 0 and self.broadcaster is not None:
+                    self._schedule_release()
+
+    def _schedule_release(self):
+        self._cancel_release()
+        self._idle_timer = threading.Timer(self.idle_timeout, self._release_if_idle)
+        self._idle_timer.daemon = True
+        self._idle_timer.start()
+
+    def _cancel_release(self):
+        if self._idle_timer:
+            self._idle_timer.cancel()
+            self._idle_timer = None
+
+    def _release_if_idle(self):
+        with self._lock:
+            if self.subscribers or self.broadcaster is None:
+                return
+            broadcaster, self.broadcaster = self.broadcaster, None
+            self._idle_timer = None
+            self.state = "idle"
+        broadcaster.stop()
+        broadcaster.capture.release()
+        print(f"🎥 Released camera after {self.idle_timeout}s without viewers")
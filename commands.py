@@ -0,0 +1,33 @@
+import collections
+
+Command = collections.namedtuple("Command", ["task_name", "payload", "port", "ack", "timeout"])
+
+# Every job a device accepts, in one place. `port` names the Arduino that
+# runs the command: "actuator" is the gate Arduino driven by DeviceEmulator,
+# "motors" the one driven by run_motors.py. `ack` is the byte the firmware
+# echoes in its acknowledgement and `timeout` the seconds allowed for it.
+COMMAND_TABLE = (
+    # task_name        payload  port        ack    timeout
+    ("small open",     b"s",    "actuator", b"s",  2),
+    ("half open",      b"m",    "actuator", b"m",  2),
+    ("full open",      b"l",    "actuator", b"l",  2),
+    ("extend_motors",  b"o",    "motors",   b"o",  5),
+    ("retract_motors", b"c",    "motors",   b"c",  5),
+)
+
+COMMANDS = {row[0]: Command(*row) for row in COMMAND_TABLE}
+
+
+def get_command(task_name):
+    """Returns the Command for `task_name`, or None when it is not a known job."""
+    return COMMANDS.get(task_name) if isinstance(task_name, str) else None
+
+
+def commands_for_port(port):
+    """Returns {task_name: Command} for every command run by the Arduino on `port`."""
+    return {name: command for name, command in COMMANDS.items() if command.port == port}
+
+
+def unknown_task_names(task_names):
+    """Returns the task names, in order and without duplicates, that are not in the registry."""
+    return list(dict.fromkeys(name for name in task_names if get_command(name) is None))
@@ -0,0 +1,6 @@
+"""pytest configuration: the tests live in tests/.
+
+test_sensors.py at the root is an interactive script for the actuator
+board, not a test module, so it is not collected.
+"""
+collect_ignore = ["test_sensors.py"]
@@ -0,0 +1,213 @@
+"""Request validation and response bodies shared by the Flask app and the asyncio runtime.
+
+Routes in both runtimes only adapt these helpers to their framework, so
+the two APIs answer with the same status codes and payloads. Validation
+errors are raised as ApiError and turned into JSON error responses.
+"""
+import datetime
+import hashlib
+import json
+from commands import get_command, unknown_task_names
+from repository.jobs import list_jobs, serialize_job, parse_completed_at, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+
+JOB_SINCE_OVERLAP = datetime.timedelta(seconds=2)  # X-Server-Time is set back this far to cover writes still committing
+ANNOUNCE_RETRY_INTERVAL = 2  # Seconds before the first announce retry, doubled up to ANNOUNCE_MAX_BACKOFF
+ANNOUNCE_MAX_BACKOFF = 60
+JOB_STREAM_KEEPALIVE = 15  # Seconds between keepalive comments on an idle /jobs/stream
+JOB_STREAM_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+
+class ApiError(ValueError):
+    """A request the API refuses, with the HTTP status to answer with."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+    def body(self):
+        return {"error": str(self)}
+
+
+def announce_delays():
+    """Yields the seconds to wait before each announce retry: exponential backoff up to ANNOUNCE_MAX_BACKOFF."""
+    delay = ANNOUNCE_RETRY_INTERVAL
+    while True:
+        yield delay
+        delay = min(delay * 2, ANNOUNCE_MAX_BACKOFF)
+
+
+def _int_arg(args, name, default=None):
+    value = args.get(name)
+    if value in (None, ""):
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise ApiError(f"{name} must be an integer")
+
+
+def _list_arg(args, name):
+    return [item for item in args.get(name, "").split(",") if item]
+
+
+def _job_name(value):
+    """Checks a job_name from a request body against the command registry. Raises ApiError."""
+    if not isinstance(value, str) or not value:
+        raise ApiError("job_name must be a non-empty string")
+    if get_command(value) is None:
+        raise ApiError(f"Unknown job_name {value}")
+    return value
+
+
+def resolve_devices(gateway, device_id):
+    """Returns the emulators a request applies to: the named one, or all of them."""
+    if device_id is None:
+        return list(gateway.devices.values())
+    emulator = gateway.get(device_id)
+    return [emulator] if emulator else []
+
+
+def get_device(gateway, device_id):
+    """Returns the emulator for `device_id` (the primary one when None). Raises ApiError 404."""
+    emulator = gateway.get(device_id)
+    if emulator is None:
+        raise ApiError("Unknown device_id", 404)
+    return emulator
+
+
+def device_info(gateway, emulator, camera_state, uptime):
+    """Body of /device_info for `emulator`; every emulator is listed under "devices" in gateway mode."""
+    info = {
+        "device_id": emulator.device_id,
+        "status": "running" if emulator.running else "stopped",
+        "state": emulator.state,
+        "camera": camera_state,
+        "uptime": round(uptime, 2),
+    }
+    if len(gateway.devices) > 1:
+        info["devices"] = [
+            {"device_id": other.device_id, "status": "running" if other.running else "stopped", "state": other.state}
+            for other in gateway.devices.values()
+        ]
+    return info
+
+
+def parse_command(data):
+    """Validates a /send_command body. Raises ApiError."""
+    if not isinstance(data, dict) or not data:
+        raise ApiError("Invalid request, JSON required")
+    _job_name(data.get("job_name"))
+    return data
+
+
+def group_commands(gateway, data):
+    """Validates a /send_commands body and returns {emulator: [commands]} in request order. Raises ApiError."""
+    if not isinstance(data, list) or not data:
+        raise ApiError("Invalid request, a non-empty JSON array of commands is required")
+    if not all(isinstance(command, dict) and isinstance(command.get("job_name"), str) and command["job_name"]
+               for command in data):
+        raise ApiError("Every command requires a job_name string")
+    unknown = unknown_task_names(command["job_name"] for command in data)
+    if unknown:
+        raise ApiError(f"Unknown job_name {', '.join(unknown)}")
+    batches = {}
+    for command in data:
+        emulator = gateway.get(command.get("device_id"))
+        if emulator is None:
+            raise ApiError(f"Unknown device_id {command.get('device_id')}", 404)
+        batches.setdefault(emulator, []).append(command)
+    return batches
+
+
+def queued_response(responses, count):
+    """Body answering /send_commands, given each emulator's send_commands() result."""
+    if len(responses) == 1:
+        return responses[0]
+    return {"status": "queued", "count": count, "devices": responses}
+
+
+def parse_job_query(args):
+    """Reads the /get-jobs filters into list_jobs() keyword arguments. Raises ApiError.
+
+    Query parameters: status and job_name (comma-separated), device_id,
+    limit, after_id and since.
+    """
+    since = args.get("since")
+    if since:
+        try:
+            since = parse_completed_at(since)  # Naive UTC, like updated_at
+        except ValueError:
+            raise ApiError("since must be an ISO 8601 timestamp")
+    return {
+        "device_id": args.get("device_id"),
+        "statuses": _list_arg(args, "status"),
+        "task_names": _list_arg(args, "job_name"),
+        "after_id": _int_arg(args, "after_id"),
+        "since": since or None,
+        "limit": max(1, min(_int_arg(args, "limit", DEFAULT_PAGE_SIZE), MAX_PAGE_SIZE)),
+    }
+
+
+def job_page(session, filters):
+    """Loads one /get-jobs page. Returns (JSON body bytes, headers including the ETag).
+
+    X-Server-Time is the next `since` cursor: taken before the query, with
+    microseconds and JOB_SINCE_OVERLAP earlier, so a job written while the page
+    loads shows up again on the next poll instead of being skipped.
+    """
+    server_time = datetime.datetime.utcnow() - JOB_SINCE_OVERLAP
+    jobs = [serialize_job(job) for job in list_jobs(session, **filters)]
+    body = json.dumps(jobs).encode()
+    headers = {
+        "ETag": f'"{hashlib.sha1(body).hexdigest()}"',
+        "X-Server-Time": server_time.isoformat(sep=" ", timespec="microseconds"),
+    }
+    if len(jobs) == filters["limit"]:
+        headers["X-Next-After-Id"] = str(jobs[-1]["id"])
+    return body, headers
+
+
+def parse_stream_query(args, headers):
+    """Reads /jobs/stream's device_id, job_name filter and resume cursor (after_id or Last-Event-ID). Raises ApiError."""
+    after_id = _int_arg(args, "after_id")
+    if after_id is None:
+        after_id = _int_arg(headers, "Last-Event-ID", 0)
+    return {"device_id": args.get("device_id"), "task_names": _list_arg(args, "job_name"), "after_id": after_id}
+
+
+def pending_jobs_after(session, device_id, task_names, after_id):
+    """Serialized pending jobs newer than `after_id`, at most MAX_PAGE_SIZE of them."""
+    jobs = list_jobs(session, device_id=device_id, statuses=["pending"], task_names=task_names,
+                     after_id=after_id, limit=MAX_PAGE_SIZE)
+    return [serialize_job(job) for job in jobs]
+
+
+def job_event(job):
+    """One job as a server-sent event."""
+    return f"id: {job['id']}\nevent: job\ndata: {json.dumps(job)}\n\n"
+
+
+def _completed_at(value):
+    try:
+        return parse_completed_at(value)
+    except (TypeError, ValueError):
+        raise ApiError("completed_at must be an ISO 8601 timestamp")
+
+
+def parse_job_update(data):
+    """Validates an /update-job body. Returns (body, completed_at). Raises ApiError."""
+    if not isinstance(data, dict):
+        raise ApiError("Invalid request, a JSON object is required")
+    if "job_name" in data:
+        _job_name(data["job_name"])
+    return data, _completed_at(data.get("completed_at"))
+
+
+def parse_job_updates(data):
+    """Validates an /update-jobs body. Returns ({id: status}, {id: completed_at}). Raises ApiError."""
+    if not isinstance(data, list) or not data:
+        raise ApiError("Invalid request, a non-empty JSON array of updates is required")
+    if not all(isinstance(item, dict) and isinstance(item.get("id"), int) and item.get("status") for item in data):
+        raise ApiError("Every update requires an integer id and a status")
+    completed_at = {item["id"]: _completed_at(item["completed_at"]) for item in data if item.get("completed_at")}
+    return {item["id"]: item["status"] for item in data}, completed_at
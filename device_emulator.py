@@ -1,23 +1,52 @@
+import time
+BOOT_TIME = time.monotonic()  # Taken before the heavy imports below, for the startup timings in the logs
 import serial
 import requests
 import json
 import threading
 import socket
-import time
 import random
 import serial.tools.list_ports
 from flask import Flask, request, jsonify, Response
 from sqlalchemy.orm import sessionmaker
 from repository.database import db_session, init_db
 from models.models import JobQueue
-import cv2
+from repository.jobs import (claim_pending_jobs, requeue_in_progress_jobs, enqueue_jobs,
+                             update_job as apply_job_update, update_job_statuses, MAX_PAGE_SIZE)
+from job_notifier import JobNotifier
+from job_compactor import JobCompactor
+from outbox import TelemetryOutbox
+from http_client import get_client
+from serial_reader import SerialIngestor, SERIAL_READ_TIMEOUT
+from serial_protocol import negotiate, JsonLineDecoder
+from actuator import ActuatorDriver, ACTUATOR_READ_TIMEOUT
+from commands import COMMANDS, commands_for_port, get_command
+from sensor_aggregator import SensorAggregator
+from timeseries import SensorHistory, parse_history_query
+from device_api import (ApiError, announce_delays, resolve_devices, get_device, device_info, parse_command,
+                        group_commands, queued_response, parse_job_query, job_page, parse_stream_query,
+                        pending_jobs_after, job_event, parse_job_update, parse_job_updates,
+                        JOB_STREAM_KEEPALIVE, JOB_STREAM_HEADERS)
 import os
 # Configuration
 SERIAL_PORT_1 = "/dev/ttyACM0"  # First Arduino (receiving data)
 SERIAL_PORT_2 = "/dev/ttyACM1"  # Second Arduino (controlling actuators)
 BAUD_RATE = 9600
+ACTUATOR_PORT = "actuator"  # Commands registered for this port (see commands.py) run on SERIAL_PORT_2
+SERIAL_PROTOCOL = "auto"  # "auto" negotiates binary frames with the Arduino firmware and falls back to JSON; "json" skips the handshake
 DEVICE_ID = "EMULATOR-001"  # Static ID for the emulator
 TESTING = True  # Set this to True to enable testing mode
+GATEWAY_MODE = False  # Drive every discovered sensor/actuator Arduino pair from this process
+RUNTIME_MODE = os.environ.get("AMAN_RUNTIME", "threaded")  # "asyncio" serves the API and all device I/O from one event loop (async_runtime.py)
+JOB_SWEEP_INTERVAL = 30  # Seconds between recovery scans of the job queue when no job is signalled
+JOB_CLAIM_BATCH = 10  # Pending jobs claimed per worker round trip
+WORKER_JOIN_TIMEOUT = 2  # Seconds stop_threads waits for each worker thread to exit
+JOB_RETENTION_DAYS = 7  # Finished jobs older than this are compacted into daily counts
+OUTBOX_DB_PATH = "telemetry_outbox.db"  # Local buffer for readings not yet accepted by the terminal
+SENSOR_HISTORY_DIR = "sensor_history"  # Memory-mapped reading history, one subdirectory per device
+SENSOR_UPLOAD_INTERVAL = 30  # Seconds between aggregated sensor summaries; spikes and deadband moves are sent at once
+READY_POLL_INTERVAL = 0.5  # Seconds between stop checks while a worker waits for bring_up() to finish
+CAMERA_IDLE_TIMEOUT = 60  # Seconds without /camera viewers before the capture device is released
 
 hostname = "simplegon-desktop"  # Get the device hostname
 
@@ -48,59 +77,107 @@ def get_first_available_camera():
 
     return "/dev/video0"  # Fallback to /dev/video0
 
-camera_device = get_first_available_camera()
-print(f"FOUND CAMERA AT : {camera_device}")
-camera = cv2.VideoCapture(camera_device)
-print(camera.isOpened())
-if camera.isOpened():
+def open_camera():
+    """Finds and opens the camera. Returns the capture, or None when no camera is available."""
+    import cv2  # OpenCV is only loaded once someone asks for the camera
+    camera_device = get_first_available_camera()
+    print(f"FOUND CAMERA AT : {camera_device}")
+    camera = cv2.VideoCapture(camera_device)
+    if not camera.isOpened():
+        camera.release()
+        print("❌ No camera found!")
+        return None
     camera.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
     camera.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
     camera.set(cv2.CAP_PROP_FPS, 30)
     print(f"🎥 Using camera device: {camera_device}")
-else:
-    camera = None
-    print("❌ No camera found!")
-
-def generate_frames():
-    """Continuously capture frames from the camera."""
-    while camera and camera.isOpened():
-        success, frame = camera.read()
-        if not success:
-            break
-        else:
-            _, buffer = cv2.imencode('.jpg', frame)
-            frame = buffer.tobytes()
-            yield (b'--frame\r\n'
-                   b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
+    return camera
+
+# The camera module (and OpenCV) is imported on the first /camera request;
+# the capture is opened for the first viewer and released once idle.
+lazy_camera = None
+lazy_camera_lock = threading.Lock()
+
+def get_camera():
+    global lazy_camera
+    with lazy_camera_lock:
+        if lazy_camera is None:
+            from camera import LazyCamera
+            lazy_camera = LazyCamera(open_camera, idle_timeout=CAMERA_IDLE_TIMEOUT)
+        return lazy_camera
+
+def camera_state():
+    """The camera's state without importing OpenCV: "idle" until the first /camera request."""
+    return lazy_camera.state if lazy_camera else "idle"
 
 # ========== SERIAL DEVICE DETECTION ==========
-def identify_arduino_ports():
-    """Identify which serial port belongs to Uno R3 (actuators) and which to ATmega (sensors)."""
-    ports = serial.tools.list_ports.comports()
-    uno_port, atmega_port = None, None
+# Arduino Uno R3 (Common VID:PID pairs)
+UNO_VID_PIDS = [(0x2341, 0x0043), (0x2341, 0x0001), (0x2A03, 0x0043), (0x2341, 0x0042)]
+# ATmega-based Arduino (Common VID:PID pairs)
+ATMEGA_VID_PIDS = [(0x2341, 0x003F), (0x2341, 0x0036), (0x1A86, 0x7523)]
+
+def usb_hub(port):
+    """The USB hub a port hangs off, from its location ("1-1.2:1.0" -> "1-1"); boards on root ports share the bus."""
+    path = (port.location or "").split(":")[0]
+    return path.rsplit(".", 1)[0] if "." in path else path.split("-")[0]
+
+def pair_boards(ports):
+    """Pairs (sensor, actuator) boards from `ports` in order. Returns (pairs, unpaired ports).
+
+    ATmega-based boards drive the actuators; Uno R3 boards alternate between
+    sensors and actuators, so adjacent Unos end up paired together.
+    """
+    sensor_ports, actuator_ports = [], []
+    for port in ports:
+        if (port.vid, port.pid) in ATMEGA_VID_PIDS:
+            actuator_ports.append(port)
+        elif len(sensor_ports) > len(actuator_ports):  # A sensor is still waiting for its actuator
+            actuator_ports.append(port)
+        else:
+            sensor_ports.append(port)
+    pairs = list(zip(sensor_ports, actuator_ports))
+    return pairs, sensor_ports[len(pairs):] + actuator_ports[len(pairs):]
+
+def identify_arduino_pairs():
+    """Identify every (sensor port, actuator port, serial number) Arduino pair attached to this host.
+
+    Boards are paired with boards on the same USB hub first (see
+    `pair_boards`); only boards left over on their hub are paired across hubs.
+    """
+    ports = sorted(serial.tools.list_ports.comports(), key=lambda port: (port.location or "", port.device))
+    hubs = {}  # USB hub -> Arduino ports on it, in USB location order
 
     for port in ports:
         print("---------")
         print(port)
         print(port.device)
-    
-        device_name = port.device
         vid_pid = (port.vid, port.pid)
         print(vid_pid)
-        # Arduino Uno R3 (Common VID:PID pairs)
-        if vid_pid in [(0x2341, 0x0043), (0x2341, 0x0001), (0x2A03, 0x0043),(0x2341,0x0042)]:
-            if(atmega_port is None):
-                atmega_port = device_name
-                print(f"✅ Found ATmega Arduino (Sensors) at {atmega_port}")
-            else:
-                uno_port = device_name
-                print(f"✅ Found Arduino Uno R3 (Actuators) at {uno_port}")
-
-        # ATmega-based Arduino (Common VID:PID pairs)
-        elif vid_pid in [(0x2341, 0x003F), (0x2341, 0x0036), (0x1A86, 0x7523)]:
-            uno_port = device_name
-            print(f"✅ Found Arduino Uno R3 (Actuators) at {uno_port}")
+        if vid_pid in UNO_VID_PIDS or vid_pid in ATMEGA_VID_PIDS:
+            hubs.setdefault(usb_hub(port), []).append(port)
+
+    board_pairs, leftovers = [], []
+    for hub_ports in hubs.values():
+        hub_pairs, unpaired = pair_boards(hub_ports)
+        board_pairs += hub_pairs
+        leftovers += unpaired
+    leftover_pairs, unpaired = pair_boards(leftovers)
+
+    pairs = []
+    for sensor_port, actuator_port in board_pairs + leftover_pairs:
+        print(f"✅ Found Arduino (Sensors) at {sensor_port.device}")
+        print(f"✅ Found Arduino (Actuators) at {actuator_port.device}")
+        pairs.append((sensor_port.device, actuator_port.device, sensor_port.serial_number))
+    for port in unpaired:
+        print(f"⚠️ No Arduino to pair with {port.device}")
+    return pairs
 
+def identify_arduino_ports():
+    """Identify which serial port belongs to Uno R3 (actuators) and which to ATmega (sensors)."""
+    pairs = identify_arduino_pairs()
+    if not pairs:
+        return None, None
+    atmega_port, uno_port, _ = pairs[0]
     return uno_port, atmega_port
 
 # if(TESTING == False):
@@ -112,7 +189,8 @@ def identify_arduino_ports():
 
 
 class DeviceEmulator:
-    def __init__(self, serial_port_1, serial_port_2, baud_rate, device_id, terminal_api_url, testing=False):
+    def __init__(self, serial_port_1, serial_port_2, baud_rate, device_id, terminal_api_url, testing=False,
+                 job_notifier=None, outbox=None, shared_scheduler=False):
         self.serial_port_1 = serial_port_1
         self.serial_port_2 = serial_port_2
         self.baud_rate = baud_rate
@@ -121,87 +199,143 @@ class DeviceEmulator:
         self.testing = testing
         self.serial_conn_1 = None
         self.serial_conn_2 = None
+        self.serial_ingestor = None
+        self.actuator = None
+        self.aggregator = SensorAggregator()
+        self.aggregated_seq = 0  # Ingestor seq of the last reading aggregated; survives re-registration like the ring buffer
+        self._aggregate_lock = threading.Lock()
+        self.history = SensorHistory(os.path.join(SENSOR_HISTORY_DIR, device_id))
         self.running = False
         self.is_registered=False
+        self.ready = threading.Event()  # Set by bring_up() once the serial ports are connected
+        self.state = "starting"  # starting -> announcing -> connecting -> ready, see bring_up()
+        self.startup_thread = None
         self.device_hostname = self.get_device_hostname()
-        self.stop_event = threading.Event()
+        self.stop_event = threading.Event()  # Replaced on every start_threads(), see there
         self.handle_jobs_thread = None
         self.read_serial_data_thread = None
         self.threads_started = False
+        self.jobs_requeued = False  # Interrupted jobs are re-queued once per process, see requeue_interrupted_jobs()
+        self._threads_lock = threading.RLock()  # Serializes register/unregister and thread start/stop
+        self.shared_scheduler = shared_scheduler  # Jobs are run by a DeviceGateway instead of our own thread
+        self.job_notifier = job_notifier or JobNotifier()
+        self.http = get_client()
+        self.outbox = outbox or TelemetryOutbox(terminal_api_url, path=OUTBOX_DB_PATH)
         init_db()
         
-    def connect_serial(self):
-        """Establish serial connections."""
+    def connect_serial(self, start_ingestor=True):
+        """Establish serial connections.
+
+        Pass `start_ingestor=False` when the caller feeds the ingestor itself (the asyncio runtime).
+        """
         if not self.testing:
             try:
-                self.serial_conn_1 = serial.Serial(self.serial_port_1, self.baud_rate, timeout=20)
+                self.serial_conn_1 = serial.Serial(self.serial_port_1, self.baud_rate, timeout=SERIAL_READ_TIMEOUT)
                 print(f"✅ Connected to serial port 1: {self.serial_port_1}")
+                decoder = negotiate(self.serial_conn_1) if SERIAL_PROTOCOL == "auto" else JsonLineDecoder()
+                self.serial_ingestor = SerialIngestor(self.serial_conn_1, decoder=decoder)
+                if start_ingestor:
+                    self.serial_ingestor.start()
 
             except serial.SerialException as e:
                 print(f"❌ Error connecting to serial 1: {e}")
                 self.serial_conn_1 = None
 
             try:
-                self.serial_conn_2 = serial.Serial(self.serial_port_2, self.baud_rate, timeout=20)
+                self.serial_conn_2 = serial.Serial(self.serial_port_2, self.baud_rate, timeout=ACTUATOR_READ_TIMEOUT)
                 print(f"✅ Connected to serial port 2: {self.serial_port_2}")
+                decoder = negotiate(self.serial_conn_2) if SERIAL_PROTOCOL == "auto" else JsonLineDecoder()
+                self.actuator = ActuatorDriver(self.serial_conn_2, decoder=decoder)
+                self.actuator.start()
             except serial.SerialException as e:
                 print(f"❌ Error connecting to serial 2: {e}")
         else:
             print("🛠️ Running in TESTING mode: No serial connections established.")
 
-    def read_serial_data(self):
+    def worker_active(self, stop_event):
+        """True while worker threads of the generation owning `stop_event` should keep running."""
+        return self.running and self.is_registered and not stop_event.is_set()
+
+    def wait_until_ready(self, stop_event):
+        """Holds a worker until bring_up() has finished. Returns False if the worker is stopped first.
+
+        A /register can arrive while the device is still announcing or
+        negotiating its serial ports; its workers wait here instead of exiting.
+        """
+        while not self.ready.is_set():
+            if stop_event.wait(READY_POLL_INTERVAL):
+                return False
+        return True
+
+    def read_serial_data(self, stop_event):
         """Continuously reads serial data and forwards it to both local and cloud APIs."""
+        if not self.wait_until_ready(stop_event):
+            return
         self.running = True
-        while self.running and self.is_registered:
+        while self.worker_active(stop_event):
             if self.testing:
-                # Generate dummy data every second
-                # required_fields = ['device_id', 'temperature', 'turbidity', 'ph_level', 'hydrogen_sulfide_level']
-                sensor_data = {
-                    "device_id": self.device_id,
-                    "temperature": round(random.uniform(20, 30), 2),
-                    "turbidity": round(random.uniform(1, 10), 2),
-                    "ph_level": round(random.uniform(6, 9), 2),
-                    "hydrogen_sulfide_level":round(random.uniform(2, 30), 2)
-                }
-                print(f"📥 [TEST MODE] Generated: {sensor_data}")
-                self.forward_to_local_api(sensor_data)
-                time.sleep(5)
+                reading = self.generate_test_reading()
+                self.history.append(time.time(), reading)
+                self.forward_to_local_api(reading)
+                stop_event.wait(5)
             else:
-                try:
-                    if self.serial_conn_1 and self.serial_conn_1.in_waiting > 0:
-                        raw_line = self.serial_conn_1.readline().decode('utf-8').strip()
-                        print(f"📥 Received: {raw_line}")
-                        
-                        try:
-                            raw_json = json.loads(raw_line)
-                            sensor_data = {
-                                "device_id": self.device_id,
-                                "temperature": raw_json["temperature"],
-                                "turbidity": raw_json["turbidity"],
-                                "ph_level":  raw_json["ph_level"],
-                                "hydrogen_sulfide_level": raw_json["hydrogen_sulfide_level"]
-                            }
-
-                            self.forward_to_local_api(sensor_data)
-                        except json.JSONDecodeError:
-                            print(f"❌ Error: Invalid JSON from serial - {raw_line}")
-                except Exception as e:
-                    print(f"❌ Error reading serial data: {e}")
-                time.sleep(30)
+                if self.serial_ingestor is None:
+                    print("⚠️ Sensor serial port is not connected.")
+                    stop_event.wait(SENSOR_UPLOAD_INTERVAL)
+                    continue
+                # Every reading the ingestor drains goes through the aggregator; only summaries,
+                # spikes and deadband moves are uploaded.
+                next_summary = time.monotonic() + SENSOR_UPLOAD_INTERVAL
+                while self.worker_active(stop_event):
+                    entries = self.serial_ingestor.wait_for_readings(self.aggregated_seq,
+                                                                     timeout=max(0, next_summary - time.monotonic()))
+                    if entries:
+                        self.aggregate_readings(entries)
+                    if time.monotonic() >= next_summary:
+                        self.report_aggregate("interval")
+                        next_summary = time.monotonic() + SENSOR_UPLOAD_INTERVAL
+
+    def generate_test_reading(self):
+        """Generates a dummy reading for testing mode."""
+        # required_fields = ['device_id', 'temperature', 'turbidity', 'ph_level', 'hydrogen_sulfide_level']
+        sensor_data = {
+            "device_id": self.device_id,
+            "temperature": round(random.uniform(20, 30), 2),
+            "turbidity": round(random.uniform(1, 10), 2),
+            "ph_level": round(random.uniform(6, 9), 2),
+            "hydrogen_sulfide_level":round(random.uniform(2, 30), 2)
+        }
+        print(f"📥 [TEST MODE] Generated: {sensor_data}")
+        return sensor_data
+
+    def aggregate_readings(self, entries):
+        """Feeds (seq, received_at, reading) entries to the aggregator, reporting spikes and deadband moves at once.
+
+        Entries at or before `aggregated_seq` were already aggregated and are skipped.
+        """
+        with self._aggregate_lock:
+            for seq, received_at, raw_json in entries:
+                if seq <= self.aggregated_seq:
+                    continue
+                self.aggregated_seq = seq
+                self.history.append(received_at, raw_json)
+                reason = self.aggregator.add(raw_json, received_at)
+                if reason:
+                    self.report_aggregate(reason)
+
+    def report_aggregate(self, reason):
+        """Queues the aggregator's summary of the readings since the last report."""
+        summary = self.aggregator.summary(reason)
+        if summary is None:
+            return
+        sensor_data = {"device_id": self.device_id, **summary}
+        print(f"📤 [{reason}] {', '.join(f'{metric}={sensor_data[metric]}' for metric in summary['stats'])}"
+              f" ({len(summary['flags'])} flags)")
+        self.forward_to_local_api(sensor_data)
 
     def forward_to_local_api(self, sensor_data):
-        """Sends water parameters to the device terminal at `http://{self.terminal_api_url}:8080/set_water_parameters`."""
-        try:
-            headers = {'Content-Type': 'application/json'}
-            response = requests.post(f"{self.terminal_api_url}/set-water-parameters", json=sensor_data, headers=headers, timeout=3)
-
-            if response.status_code == 200 or response.status_code == 201:
-                print(f"✅ Sent data to device terminal: {sensor_data} - Response: {response.json()}")
-                time.sleep(5)
-            else:
-                print(f"⚠️ Failed to send data to terminal. HTTP {response.status_code}: {response.text}")
-        except requests.RequestException as e:
-            print(f"❌ Error sending to terminal: {e}")
+        """Queues water parameters in the outbox for batched delivery to the device terminal."""
+        self.outbox.append(sensor_data)
 
     def send_command(self, command):
         """Writes the command to the database."""
@@ -209,75 +343,200 @@ class DeviceEmulator:
         job = JobQueue(device_id=self.device_id, task_name=task_name, status="pending")
         db_session.add(job)
         db_session.commit()
+        self.job_notifier.notify()
         print({"status": "queued", "command": command})
         return {"status": "queued", "command": command}
 
-    def handle_jobs(self):
-        """Fetches and executes jobs from the database."""
+    def send_commands(self, commands):
+        """Writes a batch of commands to the database in one transaction."""
+        enqueue_jobs(db_session, self.device_id, [command["job_name"] for command in commands])
+        self.job_notifier.notify()
+        print({"status": "queued", "count": len(commands)})
+        return {"status": "queued", "count": len(commands), "commands": commands}
+
+    def handle_jobs(self, stop_event):
+        """Fetches and executes jobs from the database.
+
+        The worker sleeps on `job_notifier` and is woken as soon as a job is
+        enqueued. The DB scan itself only repeats every `JOB_SWEEP_INTERVAL`
+        seconds as a recovery sweep for jobs inserted by other processes.
+        Jobs are claimed atomically in batches, so the work per round trip
+        does not grow with the size of the table.
+        """
+        if not self.wait_until_ready(stop_event):
+            return
         print("HANDLING JOBS")
-        while self.running and self.is_registered:
-            session = db_session()
-            jobs = session.query(JobQueue).filter_by(status="pending", device_id=self.device_id).all()
-            for job in jobs:
-                print("TEST")
-                print(len(jobs))
-                if self.testing:
-                    print(f"🛠️ [TEST MODE] Job executed: {job.task_name}")
-                else:
-                    if job.task_name == "small open":
-                        print("SMALL OPEN HANDLED")
-                        self.serial_conn_2.write(b's')
-                    elif job.task_name == "half open":
-                        print("HALF OPEN HANDLED")
-                        self.serial_conn_2.write(b'm')
-                    elif job.task_name == "full open":
-                        print("LARGE OPEN HANDLED")
-                        self.serial_conn_2.write(b'l')
-                    print(self.serial_conn_2)
-                job.status = "completed"
-                session.commit()
-            session.close()
+        self.requeue_interrupted_jobs()
+        while self.worker_active(stop_event):
+            version = self.job_notifier.version
+            if self.process_pending_jobs(stop_event) == JOB_CLAIM_BATCH:
+                continue  # A full batch means more jobs may be waiting
+            self.job_notifier.wait(version, timeout=JOB_SWEEP_INTERVAL)
+
+    def requeue_interrupted_jobs(self):
+        """Returns jobs a previous process left in-progress to pending.
+
+        Runs once per process: later on, in-progress jobs belong to a live
+        worker, possibly one that outlived its join timeout and is finishing
+        its batch, and re-queueing them would run them twice.
+        """
+        with self._threads_lock:
+            if self.jobs_requeued:
+                return
+            self.jobs_requeued = True
+        requeued = requeue_in_progress_jobs(db_session(), self.device_id)
+        if requeued:
+            print(f"♻️ Re-queued {requeued} interrupted jobs for {self.device_id}")
+
+    def process_pending_jobs(self, stop_event=None):
+        """Claims and executes one batch of pending jobs. Returns how many were claimed.
+
+        The DB session is released while the actuator runs, so waiting for
+        acks never holds a pooled connection (SQLite runs with just one).
+        Once `stop_event` is set, jobs not yet sent are handed back as pending.
+        """
+        session = db_session()
+        # Jobs for other Arduinos (e.g. the motors driven by run_motors.py) stay pending for their owner
+        other_ports = set(COMMANDS) - set(commands_for_port(ACTUATOR_PORT))
+        jobs = [(job.id, job.task_name) for job in
+                claim_pending_jobs(session, self.device_id, JOB_CLAIM_BATCH, exclude_task_names=other_ports)]
+        db_session.remove()
+        for job_id, status, completed_at in self.execute_jobs(jobs, stop_event):
+            update_job_statuses(db_session, {job_id: status}, {job_id: completed_at} if completed_at else None)
+            db_session.remove()
+        return len(jobs)
+
+    def execute_jobs(self, jobs, stop_event=None):
+        """Sends the actuator commands for (job id, task name) pairs and yields (job id, status, completed_at) in order.
+
+        Commands are pipelined through the ActuatorDriver, and `completed_at`
+        is the time the Arduino acknowledged the command. Once `stop_event`
+        is set no further command is sent, and the remaining jobs are yielded
+        as "pending" so another worker can claim them.
+        """
+        stopped = lambda: stop_event is not None and stop_event.is_set()
+        commands = [get_command(task_name) for _, task_name in jobs]
+
+        def to_send():
+            for command in commands:
+                if command is None:
+                    continue
+                if stopped():
+                    return
+                yield command
+
+        results = None
+        if not self.testing:
+            if self.actuator is None:
+                print("⚠️ Actuator serial port is not connected.")
+            else:
+                results = self.actuator.execute(to_send())
+        for (job_id, task_name), command in zip(jobs, commands):
+            if command is None:
+                print(f"⚠️ Unknown command: {task_name}")
+                yield job_id, "unknown_command", None
+                continue
+            if self.testing:
+                result = None if stopped() else "executed"
+            elif results is None:
+                yield job_id, "failed", None
+                continue
+            else:
+                result = next(results, None)  # None once to_send() stopped before this command
+            if result is None:
+                print(f"↩️ Worker stopping, handing {task_name} back to the queue")
+                yield job_id, "pending", None
+            elif self.testing:
+                print(f"🛠️ [TEST MODE] Job executed: {task_name}")
+                yield job_id, "completed", None
+            else:
+                print(f"{task_name.upper()} HANDLED ({result.outcome})")
+                yield job_id, "completed" if result.ok else "failed", result.completed_at
 
-            
     def start(self):
-        """Starts the serial reading thread."""
-        self.stop_event.clear()
-        response_status_code = 201
-        while(response_status_code != 200):
-            response_status_code = self.announce_to_terminal()
-            time.sleep(2)
+        """Announces the device and connects its serial ports on a background thread.
+
+        Returns immediately, so the HTTP API is served while the terminal is unreachable.
+        """
+        if self.startup_thread and self.startup_thread.is_alive():
+            return
+        self.startup_thread = threading.Thread(target=self.bring_up, daemon=True)
+        self.startup_thread.start()
+
+    def bring_up(self):
+        """Announces to the terminal with exponential backoff, then connects the serial ports."""
+        self.state = "announcing"
+        delays = announce_delays()
+        while self.announce_to_terminal() != 200:
+            time.sleep(next(delays))
+        self.state = "connecting"
         self.connect_serial()
+        self.outbox.start()
         self.running = True
+        self.state = "ready"
+        self.ready.set()
+        self.job_notifier.notify()  # Run jobs queued while the device was coming up
+        print(f"✅ {self.device_id} ready {time.monotonic() - BOOT_TIME:.2f}s after boot")
 
     def start_threads(self):
-        self.handle_jobs_thread = threading.Thread(target=self.handle_jobs, daemon=True)
-        self.read_serial_data_thread = threading.Thread(target=self.read_serial_data, daemon=True)
-        self.handle_jobs_thread.start()
-        self.read_serial_data_thread.start()
-        self.threads_started = True
-        print("STARTING THREADS")
-    def stop_threads(self):
-        self.stop_event.set()
-        if self.handle_jobs_thread:
-            self.handle_jobs_thread.join()
-        if self.read_serial_data_thread:
-            self.read_serial_data_thread.join()
-        self.handle_jobs_thread = None
-        self.read_serial_data_thread = None
-        self.threads_started = False
-        print("STOPPING THREADS")
-    def set_is_registered(self,bool):
-        self.is_registered = bool
-        # if(self.is_registered):
-        #     self.start_threads()
-        if(self.is_registered == True and self.threads_started == False ):
-            self.start_threads()
-        elif(self.is_registered == False and self.threads_started == True):
+        """Starts the worker threads unless they are already running."""
+        with self._threads_lock:
+            if self.threads_started:
+                return
+            # Each generation of workers gets its own event, so a straggler from the
+            # previous generation that outlived its join timeout can never be revived.
+            self.stop_event = threading.Event()
+            if not self.shared_scheduler:
+                self.handle_jobs_thread = threading.Thread(target=self.handle_jobs, args=(self.stop_event,), daemon=True)
+                self.handle_jobs_thread.start()
+            else:
+                self.job_notifier.notify()  # Let the gateway pick up jobs queued while unregistered
+            self.read_serial_data_thread = threading.Thread(target=self.read_serial_data, args=(self.stop_event,), daemon=True)
+            self.read_serial_data_thread.start()
+            self.threads_started = True
+            print("STARTING THREADS")
+
+    def stop_threads(self, timeout=WORKER_JOIN_TIMEOUT):
+        """Signals the worker threads to exit and waits at most `timeout` seconds for each."""
+        with self._threads_lock:
+            if not self.threads_started:
+                return
             self.stop_event.set()
-            
+            if self.handle_jobs_thread:
+                self.job_notifier.notify()  # Wake handle_jobs from its notifier wait
+            if self.serial_ingestor:
+                self.serial_ingestor.wake()  # Wake read_serial_data from its wait for readings
+            for thread in (self.handle_jobs_thread, self.read_serial_data_thread):
+                if thread:
+                    thread.join(timeout)
+                    if thread.is_alive():
+                        print(f"⚠️ A worker thread of {self.device_id} did not stop within {timeout}s, leaving it to finish")
+            self.handle_jobs_thread = None
+            self.read_serial_data_thread = None
+            self.threads_started = False
+            print("STOPPING THREADS")
+
+    def set_is_registered(self, registered):
+        """Starts or stops the worker threads. Repeated calls with the same value are no-ops."""
+        with self._threads_lock:
+            self.is_registered = registered
+            if registered:
+                self.start_threads()
+            else:
+                self.stop_threads()
+
+
     def stop(self):
         """Stops the emulator."""
+        self.stop_threads()
         self.running = False
+        self.ready.clear()
+        self.outbox.stop()
+        self.history.flush()
+        if self.serial_ingestor:
+            self.serial_ingestor.stop()
+        if self.actuator:
+            self.actuator.stop()
         if self.serial_conn_1:
             self.serial_conn_1.close()
         if self.serial_conn_2:
@@ -294,19 +553,23 @@ class DeviceEmulator:
             print(f"❌ Error getting local IP: {e}")
             return "127.0.0.1"
 
+    def announcement(self):
+        """Payload announcing the device to the terminal as available."""
+        return {
+            "device_id": self.device_id,
+            "device_hostname": self.device_hostname,
+            "status": "available"
+        }
+
     def announce_to_terminal(self):
         """Announces the device to the terminal as available."""
         try:
             url = f"{self.terminal_api_url}/register_device"
             
-            payload = {
-                "device_id": self.device_id,
-                "device_hostname": self.device_hostname,
-                "status": "available"
-            }
+            payload = self.announcement()
             headers = {'Content-Type': 'application/json'}
             print("API TERMINAL URL"+ self.terminal_api_url)
-            response = requests.post(url, json=payload, headers=headers, timeout=5)
+            response = self.http.post(url, json=payload, headers=headers, timeout=5)
             
             if response.status_code == 200:
                 print(f"✅ Announced to terminal: {payload}")
@@ -319,34 +582,145 @@ class DeviceEmulator:
             time.sleep(1)
             return "Failed"
    
-# Initialize the emulator
-device = DeviceEmulator(SERIAL_PORT_1, SERIAL_PORT_2, BAUD_RATE, DEVICE_ID, TERMINAL_API_URL, testing=TESTING)
-device.start()
+class DeviceGateway:
+    """Runs one DeviceEmulator per Arduino pair in a single process.
+
+    Emulators share one job notifier, one telemetry outbox and one job
+    scheduler thread that serves every registered device, and requests are
+    routed to them by device_id. Without gateway mode it holds a single
+    emulator that runs its own job thread.
+    """
+
+    def __init__(self, terminal_api_url):
+        self.devices = {}
+        self.job_notifier = JobNotifier()
+        self.outbox = TelemetryOutbox(terminal_api_url, path=OUTBOX_DB_PATH)
+        self.scheduler_thread = None
+
+    @property
+    def primary(self):
+        return next(iter(self.devices.values()), None)
+
+    def add(self, emulator):
+        self.devices[emulator.device_id] = emulator
+        return emulator
+
+    def get(self, device_id=None):
+        """Returns the emulator for `device_id`, or the primary one when no id is given."""
+        if device_id is None:
+            return self.primary
+        return self.devices.get(device_id)
+
+    def start(self):
+        for emulator in self.devices.values():
+            emulator.start()
+        if any(emulator.shared_scheduler for emulator in self.devices.values()):
+            self.scheduler_thread = threading.Thread(target=self.schedule_jobs, daemon=True)
+            self.scheduler_thread.start()
+
+    def schedule_jobs(self):
+        """Runs pending jobs for every registered device from a single thread."""
+        for emulator in self.devices.values():
+            emulator.requeue_interrupted_jobs()
+        while True:
+            version = self.job_notifier.version
+            busy = False
+            for emulator in list(self.devices.values()):
+                if emulator.running and emulator.is_registered:
+                    busy |= emulator.process_pending_jobs() == JOB_CLAIM_BATCH
+            if not busy:
+                self.job_notifier.wait(version, timeout=JOB_SWEEP_INTERVAL)
+
+def create_gateway():
+    gateway = DeviceGateway(TERMINAL_API_URL)
+    pairs = identify_arduino_pairs() if GATEWAY_MODE and not TESTING else []
+    if GATEWAY_MODE and not pairs:
+        print("⚠️ Gateway mode found no Arduino pairs, running a single device.")
+    for index, (sensor_port, actuator_port, serial_number) in enumerate(pairs):
+        device_id = f"{DEVICE_ID}-{serial_number or index + 1}"
+        gateway.add(DeviceEmulator(sensor_port, actuator_port, BAUD_RATE, device_id, TERMINAL_API_URL, testing=TESTING,
+                                   job_notifier=gateway.job_notifier, outbox=gateway.outbox, shared_scheduler=True))
+    if not gateway.devices:
+        gateway.add(DeviceEmulator(SERIAL_PORT_1, SERIAL_PORT_2, BAUD_RATE, DEVICE_ID, TERMINAL_API_URL, testing=TESTING,
+                                   job_notifier=gateway.job_notifier, outbox=gateway.outbox))
+    return gateway
+
+# Initialize the emulators
+gateway = create_gateway()
+device = gateway.primary
+job_compactor = JobCompactor(retention_days=JOB_RETENTION_DAYS)
+job_compactor.start()
+if RUNTIME_MODE != "asyncio":
+    gateway.start()  # The asyncio runtime announces and connects devices from its own event loop
+
+first_request_served = False
+
+@app.before_request
+def log_first_request():
+    global first_request_served
+    if not first_request_served:
+        first_request_served = True
+        print(f"⏱️ First request {request.path} {time.monotonic() - BOOT_TIME:.2f}s after boot")
+
+@app.errorhandler(ApiError)
+def api_error(error):
+    return jsonify(error.body()), error.status
+
+@app.teardown_appcontext
+def shutdown_session(exception=None):
+    """Return the request's DB connection to the pool (SQLite runs with a single connection)."""
+    db_session.remove()
 
 @app.route('/register', methods=['POST'])
 def register_device():
-    device.set_is_registered(True)
+    emulators = resolve_devices(gateway, request.args.get("device_id"))
+    if not emulators:
+        return jsonify({"error": "Unknown device_id"}), 404
+    for emulator in emulators:
+        emulator.set_is_registered(True)
     return jsonify({"status": "success", "message": "Device registered successfully."})
 
 @app.route('/unregister', methods=['POST'])
 def unregister_device():
-    device.set_is_registered(False)
+    emulators = resolve_devices(gateway, request.args.get("device_id"))
+    if not emulators:
+        return jsonify({"error": "Unknown device_id"}), 404
+    for emulator in emulators:
+        emulator.set_is_registered(False)
     return jsonify({"status": "success", "message": "Device unregistered successfully."})
 
 @app.route('/send_command', methods=['POST'])
 def send_command():
-    """API endpoint for the terminal to send commands to the emulator."""
-    data = request.json
+    """API endpoint for the terminal to send commands to the emulator.
+
+    In gateway mode the command's device_id selects the emulator.
+    """
+    data = parse_command(request.get_json(silent=True))
     print(data)
-    if not data:
-        return jsonify({"error": "Invalid request, JSON required"}), 400
-    response = device.send_command(data)
+    response = get_device(gateway, data.get("device_id")).send_command(data)
     return jsonify(response)
 
+@app.route('/send_commands', methods=['POST'])
+def send_commands():
+    """API endpoint for the terminal to queue a list of commands in one request."""
+    batches = group_commands(gateway, request.get_json(silent=True))
+    try:
+        responses = [emulator.send_commands(commands) for emulator, commands in batches.items()]
+        return jsonify(queued_response(responses, sum(map(len, batches.values()))))
+    except Exception as e:
+        db_session.rollback()
+        return jsonify({"error": str(e)}), 500
+    finally:
+        db_session.close()
+
 @app.route('/device_info', methods=['GET'])
 def get_device_info():
-    """Returns device information including its static ID."""
-    return jsonify({"device_id": device.device_id, "status": "running" if device.running else "stopped"})
+    """Returns device information including its static ID and startup readiness.
+
+    Pass device_id to pick an emulator in gateway mode; every emulator is listed under "devices".
+    """
+    emulator = get_device(gateway, request.args.get("device_id"))
+    return jsonify(device_info(gateway, emulator, camera_state(), time.monotonic() - BOOT_TIME))
 
 @app.route('/')
 def home():
@@ -354,37 +728,64 @@ def home():
 
 @app.route("/get-jobs", methods=["GET"])
 def get_jobs():
+    """Returns one page of jobs in id order.
+
+    Query parameters: status and job_name (comma-separated), device_id, limit, after_id
+    (keyset cursor, see the X-Next-After-Id header) and since (jobs written at or
+    after this UTC time, see the X-Server-Time header). Responses
+    carry an ETag, so an unchanged page is answered with 304 Not Modified.
+    """
+    filters = parse_job_query(request.args)
     try:
-        jobs = db_session.query(JobQueue).all()
-        serialized_jobs = [
-            {
-                "id": job.id,
-                "job_name": job.task_name,
-                "status": job.status,
-                "issued_at": job.issued_at.strftime('%Y-%m-%d %H:%M:%S')
-            }
-            for job in jobs
-        ]
-        return jsonify(serialized_jobs), 200
+        body, headers = job_page(db_session, filters)
+        response = Response(body, mimetype="application/json", headers=headers)
+        return response.make_conditional(request)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
+    finally:
+        db_session.close()
+
+
+def generate_job_events(device_id, task_names, after_id):
+    """Yields pending jobs newer than `after_id` as server-sent events, waking on every enqueue."""
+    try:
+        while True:
+            version = device.job_notifier.version
+            jobs = pending_jobs_after(db_session, device_id, task_names, after_id)
+            db_session.close()  # Do not hold a pooled connection while idle
 
+            for job in jobs:
+                after_id = job["id"]
+                yield job_event(job)
+            if len(jobs) == MAX_PAGE_SIZE:
+                continue
+            if device.job_notifier.wait(version, timeout=JOB_STREAM_KEEPALIVE) == version:
+                yield ": keepalive\n\n"
+    finally:
+        db_session.remove()
+
+@app.route("/jobs/stream", methods=["GET"])
+def stream_jobs():
+    """Server-sent events stream that pushes pending jobs the moment they are enqueued.
+
+    Query parameters: device_id, job_name (comma-separated) and after_id.
+    Reconnecting clients may send Last-Event-ID instead of after_id to
+    resume where they left off.
+    """
+    query = parse_stream_query(request.args, request.headers)
+    return Response(
+        generate_job_events(query["device_id"], query["task_names"], query["after_id"]),
+        mimetype="text/event-stream",
+        headers=JOB_STREAM_HEADERS,
+    )
 
 @app.route("/update-job/<int:job_id>", methods=["PUT"])
 def update_job(job_id):
+    data, completed_at = parse_job_update(request.get_json(silent=True))
     try:
-        data = request.get_json()
-        job = db_session.query(JobQueue).filter(JobQueue.id == job_id).first()
-
-        if job is None:
+        if not apply_job_update(db_session, job_id, data, completed_at):
             return jsonify({"message": "Job not found"}), 404
-
-        if "job_name" in data:
-            job.job_name = data['job_name']
-        if "status" in data:
-            job.status = data['status']
-
-        db_session.commit()
+        device.job_notifier.notify()
         return jsonify({"message": "Job updated successfully"}), 200
     except Exception as e:
         db_session.rollback()
@@ -392,12 +793,62 @@ def update_job(job_id):
     finally:
         db_session.close()
         
+@app.route("/update-jobs", methods=["PUT"])
+def update_jobs():
+    """Applies many job status updates, given as [{"id": ..., "status": ..., "completed_at": optional}], in one transaction."""
+    updates, completed_at = parse_job_updates(request.get_json(silent=True))
+    try:
+        not_found = update_job_statuses(db_session, updates, completed_at)
+        device.job_notifier.notify()
+        return jsonify({"message": "Jobs updated successfully", "updated": len(updates) - len(not_found), "not_found": not_found}), 200
+    except Exception as e:
+        db_session.rollback()
+        return jsonify({"error": str(e)}), 500
+    finally:
+        db_session.close()
+
+@app.route("/sensor-history", methods=["GET"])
+def sensor_history():
+    """Returns one metric's history from the on-device store.
+
+    Query parameters: metric, from and to (epoch seconds or ISO 8601, UTC
+    when naive; default the last 24 hours), step (bucket seconds, chosen
+    automatically when omitted) and device_id in gateway mode. The result
+    is columnar: "t", "mean", "min", "max" and "count" lists.
+    """
+    emulator = get_device(gateway, request.args.get("device_id"))
+    try:
+        metric, start, end, step = parse_history_query(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"device_id": emulator.device_id, **emulator.history.query(metric, start, end, step)})
+
 @app.route('/camera')
 def video_feed():
-    """Stream the camera feed as an MJPEG stream."""
-    return Response(generate_frames(), mimetype='multipart/x-mixed-replace; boundary=frame')
+    """Stream the camera feed as an MJPEG stream.
 
-if __name__ == "__main__":
+    Optional query parameters: quality (1-100), fps, scale (0-1], gray=1 and
+    auto=1 to lower quality automatically on slow links.
+    """
+    from camera import StreamSettings
+    try:
+        settings = StreamSettings.from_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    camera = get_camera()
+    if not camera.ensure_open():
+        return jsonify({"error": "Camera is not available", "camera": camera.state}), 503
+    return Response(camera.frames(settings), mimetype='multipart/x-mixed-replace; boundary=frame')
 
-    app.run(host="0.0.0.0", port=8082, debug=False)
+if __name__ == "__main__":
+    if RUNTIME_MODE == "asyncio":
+        from async_runtime import run_async
+        run_async(gateway, host="0.0.0.0", port=8082,
+                  get_camera=get_camera, camera_state=camera_state, boot_time=BOOT_TIME,
+                  upload_interval=SENSOR_UPLOAD_INTERVAL,
+                  sweep_interval=JOB_SWEEP_INTERVAL,
+                  claim_batch=JOB_CLAIM_BATCH)
+    else:
+        print(f"⏱️ Serving {time.monotonic() - BOOT_TIME:.2f}s after boot")
+        app.run(host="0.0.0.0", port=8082, debug=False)
 
@@ -0,0 +1,76 @@
+import threading
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Connection pool settings shared by every outbound HTTP call
+POOL_CONNECTIONS = 4  # Number of hosts to keep pools for
+POOL_MAXSIZE = 8  # Keep-alive connections per host
+DEFAULT_TIMEOUT = 5  # Seconds, used when a host has no entry in HOST_TIMEOUTS
+HOST_TIMEOUTS = {}  # e.g. {"amanrest-925084270691.asia-east2.run.app": (3.05, 10)}
+RETRY_TOTAL = 3
+RETRY_BACKOFF_FACTOR = 0.5
+RETRY_STATUS_FORCELIST = (502, 503, 504)
+
+
+class HttpClient:
+    """Keep-alive HTTP client backed by a pooled `requests.Session`.
+
+    Connections (and TLS sessions) are reused across calls. Timeouts can be
+    set per host, and idempotent requests plus connection failures are
+    retried with exponential backoff.
+    """
+
+    def __init__(self, pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE,
+                 default_timeout=DEFAULT_TIMEOUT, host_timeouts=None, retries=RETRY_TOTAL,
+                 backoff_factor=RETRY_BACKOFF_FACTOR, status_forcelist=RETRY_STATUS_FORCELIST):
+        self.default_timeout = default_timeout
+        self.host_timeouts = dict(HOST_TIMEOUTS if host_timeouts is None else host_timeouts)
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=status_forcelist,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def set_host_timeout(self, host, timeout):
+        self.host_timeouts[host] = timeout
+
+    def timeout_for(self, url):
+        return self.host_timeouts.get(urlsplit(url).hostname, self.default_timeout)
+
+    def request(self, method, url, **kwargs):
+        """Sends a request through the shared pool. An explicit `timeout` overrides the host default."""
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = self.timeout_for(url)
+        return self.session.request(method, url, **kwargs)
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def put(self, url, **kwargs):
+        return self.request("PUT", url, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """Returns the process-wide HttpClient, creating it on first use."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = HttpClient()
+        return _client
@@ -0,0 +1,65 @@
+import datetime
+import threading
+from repository.database import db_session
+from repository.jobs import compact_finished_jobs
+
+JOB_RETENTION_DAYS = 7  # Finished jobs older than this are rolled up into job_daily_stats
+JOB_COMPACTION_INTERVAL = 3600  # Seconds between compaction runs
+JOB_COMPACTION_BATCH = 200  # Jobs removed per transaction
+JOB_COMPACTION_PAUSE = 0.5  # Seconds between batches so workers can get at the queue
+
+
+class JobCompactor:
+    """Background task that keeps job_queue bounded on long-running devices.
+
+    Finished jobs older than the retention window are rolled up into per-day
+    counts and deleted in small batches, pausing between batches so the live
+    queue is never locked for long.
+    """
+
+    def __init__(self, retention_days=JOB_RETENTION_DAYS, interval=JOB_COMPACTION_INTERVAL,
+                 batch_size=JOB_COMPACTION_BATCH, pause=JOB_COMPACTION_PAUSE):
+        self.retention_days = retention_days
+        self.interval = interval
+        self.batch_size = batch_size
+        self.pause = pause
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5):
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout)
+        self._thread = None
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                db_session.rollback()
+                print(f"❌ Error compacting job queue: {e}")
+            finally:
+                db_session.remove()
+            self._stop_event.wait(self.interval)
+
+    def run_once(self):
+        """Compacts every finished job past the retention window. Returns the number removed."""
+        cutoff = datetime.datetime.utcnow() - datetime.timedelta(days=self.retention_days)
+        removed = 0
+        while not self._stop_event.is_set():
+            batch = compact_finished_jobs(db_session, cutoff, self.batch_size)
+            removed += batch
+            if batch < self.batch_size:
+                break
+            self._stop_event.wait(self.pause)
+        if removed:
+            print(f"🧹 Compacted {removed} finished jobs older than {self.retention_days} days")
+        return removed
@@ -0,0 +1,63 @@
+import asyncio
+import threading
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(None)
+
+
+class JobNotifier:
+    """Wakes job consumers the moment a job is enqueued or updated.
+
+    Producers call `notify()` after committing a job. Consumers remember the
+    version they last saw and block in `wait()` (or await `wait_async()` on an
+    event loop) until it changes or the timeout elapses, so a notification
+    that lands between a DB scan and the next wait is never lost.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._version = 0
+        self._async_waiters = []  # (loop, future) pairs from wait_async()
+
+    @property
+    def version(self):
+        with self._condition:
+            return self._version
+
+    def notify(self):
+        """Signal every waiting consumer that the job queue changed."""
+        with self._condition:
+            self._version += 1
+            self._condition.notify_all()
+            waiters, self._async_waiters = self._async_waiters, []
+        for loop, future in waiters:
+            loop.call_soon_threadsafe(_resolve, future)
+
+    def wait(self, last_version, timeout=None):
+        """Block until the version moves past `last_version` or `timeout` expires.
+
+        Returns the current version.
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: self._version != last_version, timeout)
+            return self._version
+
+    async def wait_async(self, last_version, timeout=None):
+        """Event-loop friendly `wait()`. Returns the current version."""
+        with self._condition:
+            if self._version != last_version:
+                return self._version
+            loop = asyncio.get_running_loop()
+            future = loop.create_future()
+            self._async_waiters.append((loop, future))
+        try:
+            await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            with self._condition:
+                if (loop, future) in self._async_waiters:
+                    self._async_waiters.remove((loop, future))
+        return self.version
@@ -1,4 +1,5 @@
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, Float, ForeignKey, LargeBinary
+from sqlalchemy import Column, Integer, String, Date, DateTime, Boolean, Float, ForeignKey, LargeBinary, Index
+from sqlalchemy.dialects import mysql
 from sqlalchemy.orm import relationship
 from repository.database import Base
 import datetime
@@ -16,9 +17,18 @@ class JobQueue(Base):
 
     issued_at = Column(DateTime, default=datetime.datetime.utcnow)
     completed_at = Column(DateTime, nullable=True)
+    # Server time of the last write, the change marker behind /get-jobs?since (microseconds on MySQL too)
+    updated_at = Column(DateTime().with_variant(mysql.DATETIME(fsp=6), "mysql"), nullable=True,
+                        default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow,
+                        info={"backfill": "COALESCE(completed_at, issued_at)"})
 
     issued_by = Column(Integer, nullable=True)  # User ID who issued the task
 
+    # Every worker query filters on device and status and takes the oldest first
+    __table_args__ = (
+        Index('ix_job_queue_device_status_issued', 'device_id', 'status', 'issued_at'),
+        Index('ix_job_queue_updated', 'updated_at'),  # /get-jobs?since polling
+    )
 
     def __init__(self, device_id, task_name, status="pending"):
         self.device_id = device_id
@@ -27,3 +37,30 @@ class JobQueue(Base):
 
     def __repr__(self):
         return f"<JobQueue(id={self.id}, device_id={self.device_id}, task={self.task_name}, status={self.status})>"
+
+
+# --- Job Daily Stats Model ---
+class JobDailyStats(Base):
+    """Per-day job counts kept after finished jobs are compacted out of job_queue."""
+    __tablename__ = 'job_daily_stats'
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    day = Column(Date, nullable=False)
+    device_id = Column(String(255), nullable=False)
+    task_name = Column(String(100), nullable=False)
+    status = Column(String(50), nullable=False)
+    count = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        Index('ix_job_daily_stats_key', 'day', 'device_id', 'task_name', 'status', unique=True),
+    )
+
+    def __init__(self, day, device_id, task_name, status, count=0):
+        self.day = day
+        self.device_id = device_id
+        self.task_name = task_name
+        self.status = status
+        self.count = count
+
+    def __repr__(self):
+        return f"<JobDailyStats(day={self.day}, device_id={self.device_id}, task={self.task_name}, status={self.status}, count={self.count})>"
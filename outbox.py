@@ -0,0 +1,253 @@
+import json
+import sqlite3
+import threading
+import time
+import requests
+from http_client import get_client
+
+# Defaults for the telemetry outbox
+OUTBOX_DB_PATH = "telemetry_outbox.db"
+OUTBOX_BATCH_SIZE = 50  # Flush as soon as this many readings are buffered
+OUTBOX_MAX_AGE = 10  # Seconds the oldest buffered reading may wait before a flush
+OUTBOX_MAX_ROWS = 100000  # Oldest readings are dropped beyond this to protect the SD card
+OUTBOX_INITIAL_BACKOFF = 1  # Seconds to wait after the first failed flush
+OUTBOX_MAX_BACKOFF = 300  # Upper bound for the exponential backoff
+BULK_ENDPOINT = "/set-water-parameters/bulk"
+SINGLE_ENDPOINT = "/set-water-parameters"
+BULK_TIMEOUT = 5  # Seconds allowed for one bulk upload
+SINGLE_TIMEOUT = 3  # Seconds allowed for one per-reading upload
+# 4xx answers that say nothing about the reading itself (a missing route, auth or rate limiting), so they are retried
+RETRYABLE_CLIENT_ERRORS = (401, 403, 404, 405, 408, 425, 429)
+
+
+def is_rejection(status):
+    """True when the terminal refused the payload itself and retrying it can never succeed."""
+    return 400 <= status < 500 and status not in RETRYABLE_CLIENT_ERRORS
+
+
+class Delivery:
+    """Progress of one batch upload.
+
+    `done` counts the leading rows the terminal either accepted or
+    permanently rejected; rejected rows are also listed in `rejected` as
+    (row id, reading, status, response text). `retry` is set when the upload
+    stopped on a connection error or a retryable answer.
+    """
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.done = 0
+        self.rejected = []
+        self.retry = False
+
+    @property
+    def readings(self):
+        return [reading for _, reading in self.rows]
+
+
+class TelemetryOutbox:
+    """Durable, batched uplink for sensor readings.
+
+    Readings are appended to a local SQLite table and only deleted once the
+    terminal accepts them. A sender thread ships them in batches to the bulk
+    endpoint, backing off exponentially while the terminal is unreachable or
+    failing and replaying the backlog once it comes back. Readings the
+    terminal rejects outright (a non-retryable 4xx) are moved to the
+    `rejected` table, so one bad reading cannot block the ones behind it.
+
+    The upload itself is written as a generator (`uploads()`), so the
+    asyncio runtime drives the same batching and classification with aiohttp.
+    """
+
+    def __init__(self, terminal_api_url, path=OUTBOX_DB_PATH, batch_size=OUTBOX_BATCH_SIZE,
+                 max_age=OUTBOX_MAX_AGE, max_rows=OUTBOX_MAX_ROWS, max_backoff=OUTBOX_MAX_BACKOFF):
+        self.terminal_api_url = terminal_api_url
+        self.path = path
+        self.batch_size = batch_size
+        self.max_age = max_age
+        self.max_rows = max_rows
+        self.max_backoff = max_backoff
+        self.bulk_supported = True
+        self.http = get_client()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS outbox ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+            "created_at REAL NOT NULL, "
+            "payload TEXT NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS rejected ("
+            "id INTEGER PRIMARY KEY, "
+            "created_at REAL NOT NULL, "
+            "rejected_at REAL NOT NULL, "
+            "status INTEGER NOT NULL, "
+            "reason TEXT, "
+            "payload TEXT NOT NULL)"
+        )
+        self._conn.commit()
+
+    def append(self, reading):
+        """Persist a reading for delivery and wake the sender."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO outbox (created_at, payload) VALUES (?, ?)",
+                (time.time(), json.dumps(reading)),
+            )
+            self._conn.execute(
+                "DELETE FROM outbox WHERE id <= (SELECT MAX(id) FROM outbox) - ?",
+                (self.max_rows,),
+            )
+            self._conn.commit()
+        self._wakeup.set()
+
+    def pending(self):
+        """Returns (buffered reading count, created_at of the oldest one or None)."""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*), MIN(created_at) FROM outbox").fetchone()
+
+    def flush_delay(self):
+        """Seconds until the next batch is due: 0 to flush now, None while the outbox is empty."""
+        count, oldest = self.pending()
+        if count == 0:
+            return None
+        age = time.time() - oldest
+        if count < self.batch_size and age < self.max_age:
+            return self.max_age - age
+        return 0
+
+    def next_backoff(self, backoff):
+        """Doubles the retry delay after a failed flush, within OUTBOX_INITIAL_BACKOFF and `max_backoff`."""
+        backoff = min(max(backoff * 2, OUTBOX_INITIAL_BACKOFF), self.max_backoff)
+        print(f"⏳ Terminal unreachable or failing, {self.pending()[0]} readings buffered. Retrying in {backoff}s.")
+        return backoff
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        print("📤 Telemetry outbox started.")
+
+    def stop(self, timeout=5):
+        self._stop_event.set()
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join(timeout)
+        self._thread = None
+
+    def _run(self):
+        backoff = 0
+        while not self._stop_event.is_set():
+            delay = self.flush_delay()
+            if delay != 0:
+                self._wait(delay)
+                continue
+
+            if self.flush_batch():
+                backoff = 0
+            else:
+                backoff = self.next_backoff(backoff)
+                self._stop_event.wait(backoff)
+
+    def _wait(self, timeout):
+        self._wakeup.wait(timeout)
+        self._wakeup.clear()
+
+    def next_batch(self):
+        """Returns the oldest buffered readings as (id, reading) pairs, at most `batch_size` of them."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, payload FROM outbox ORDER BY id LIMIT ?", (self.batch_size,)
+            ).fetchall()
+        return [(row_id, json.loads(payload)) for row_id, payload in rows]
+
+    def finish(self, delivery):
+        """Removes the rows `delivery` is done with, keeping the rejected ones in the `rejected` table."""
+        if not delivery.done:
+            return
+        last_id = delivery.rows[delivery.done - 1][0]
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO rejected (id, created_at, rejected_at, status, reason, payload) "
+                "SELECT id, created_at, ?, ?, ?, payload FROM outbox WHERE id = ?",
+                [(now, status, text[:500], row_id) for row_id, _, status, text in delivery.rejected],
+            )
+            self._conn.execute("DELETE FROM outbox WHERE id <= ?", (last_id,))
+            self._conn.execute(
+                "DELETE FROM rejected WHERE id <= (SELECT MAX(id) FROM rejected) - ?",
+                (self.max_rows,),
+            )
+            self._conn.commit()
+        accepted = delivery.done - len(delivery.rejected)
+        if accepted:
+            print(f"✅ Sent {accepted} readings to device terminal.")
+        if delivery.rejected:
+            print(f"🗑️ Terminal rejected {len(delivery.rejected)} readings, moved them to the rejected table.")
+
+    def uploads(self, delivery):
+        """Generator of the uploads for `delivery`, recording their outcome in it as it goes.
+
+        Yields (url, json body, timeout) and expects each response's
+        (status, text) to be sent back. The bulk endpoint is tried first;
+        if it rejects the batch, the batch is re-sent one reading at a time
+        so only the offending readings are dropped.
+        """
+        if self.bulk_supported:
+            status, text = yield f"{self.terminal_api_url}{BULK_ENDPOINT}", {"readings": delivery.readings}, BULK_TIMEOUT
+            if status in (404, 405):
+                print("⚠️ Terminal has no bulk endpoint, falling back to per-reading uploads.")
+                self.bulk_supported = False
+            elif status in (200, 201):
+                delivery.done = len(delivery.rows)
+                return
+            elif is_rejection(status):
+                print(f"⚠️ Terminal rejected the batch with HTTP {status}, retrying it one reading at a time.")
+            else:
+                print(f"⚠️ Failed to send data to terminal. HTTP {status}: {text}")
+                delivery.retry = True
+                return
+
+        for row_id, reading in delivery.rows:
+            status, text = yield f"{self.terminal_api_url}{SINGLE_ENDPOINT}", reading, SINGLE_TIMEOUT
+            if is_rejection(status):
+                print(f"⚠️ Terminal rejected a reading. HTTP {status}: {text}")
+                delivery.rejected.append((row_id, reading, status, text))
+            elif status not in (200, 201):
+                print(f"⚠️ Failed to send data to terminal. HTTP {status}: {text}")
+                delivery.retry = True
+                return
+            delivery.done += 1
+
+    def flush_batch(self):
+        """Sends the oldest batch of buffered readings. Returns False when the flush should be retried later."""
+        rows = self.next_batch()
+        if not rows:
+            return True
+
+        delivery = Delivery(rows)
+        self._send(delivery)
+        self.finish(delivery)
+        return not delivery.retry
+
+    def _send(self, delivery):
+        headers = {'Content-Type': 'application/json'}
+        uploads = self.uploads(delivery)
+        try:
+            url, body, timeout = next(uploads)
+            while True:
+                response = self.http.post(url, json=body, headers=headers, timeout=timeout)
+                url, body, timeout = uploads.send((response.status_code, response.text))
+        except StopIteration:
+            pass
+        except requests.RequestException as e:
+            print(f"❌ Error sending to terminal: {e}")
+            delivery.retry = True
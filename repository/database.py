@@ -1,27 +1,30 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, inspect, text
 from sqlalchemy.orm import scoped_session, sessionmaker, declarative_base
 import os
 
-# PostgreSQL Connection Parameters
-# user = os.environ["DB_USER"]
-# password = os.environ["DB_PASSWORD"]
-# host = os.environ["DB_HOST"]
-# port = os.environ["DB_PORT"]
-# database = os.environ["DB_DB"]
-user = "aman_user" # Default to 'root'
-password ="securepassword"# Default empty (set password if configured)
-host =  "localhost" # Default to localhost
-port = "3306"  # MySQL default port
-database =  "AMAN_DEVICE"  # Default database (change as needed)
+# MySQL Connection Parameters (override through the environment)
+user = os.environ.get("DB_USER", "aman_user")
+password = os.environ.get("DB_PASSWORD", "securepassword")
+host = os.environ.get("DB_HOST", "localhost")
+port = os.environ.get("DB_PORT", "3306")  # MySQL default port
+database = os.environ.get("DB_DB", "AMAN_DEVICE")
 
-connection_str = f"mysql+pymysql://{user}:{password}@{host}:{port}/{database}"
+# DATABASE_URL selects the backend, e.g. "sqlite:///sqlite_dev.db" for an embedded store without a MySQL server
+connection_str = os.environ.get("DATABASE_URL", f"mysql+pymysql://{user}:{password}@{host}:{port}/{database}")
+is_sqlite = connection_str.startswith("sqlite")
 
 # Connection Pooling Settings
-connect_args = {}  # PostgreSQL requires no special connect args
-pool_size = 10  # Increase this if needed (default: 5)
-max_overflow = 20  # How many extra connections can be created (default: 10)
-pool_timeout = 30  # Seconds before timing out
-pool_recycle = 1800  # Recycle connections every 30 minutes
+# SQLite allows a single writer, so its pool defaults to one connection that every thread takes turns on
+pool_size = int(os.environ.get("DB_POOL_SIZE", 1 if is_sqlite else 10))
+max_overflow = int(os.environ.get("DB_MAX_OVERFLOW", 0 if is_sqlite else 20))  # How many extra connections can be created
+pool_timeout = int(os.environ.get("DB_POOL_TIMEOUT", 30))  # Seconds before timing out
+pool_recycle = int(os.environ.get("DB_POOL_RECYCLE", 1800))  # Recycle connections every 30 minutes
+sqlite_busy_timeout = int(os.environ.get("DB_BUSY_TIMEOUT_MS", 5000))  # Milliseconds SQLite waits on a locked database
+
+connect_args = {}
+if is_sqlite:
+    # Sessions are handed between worker threads through the pool
+    connect_args = {"check_same_thread": False, "timeout": sqlite_busy_timeout / 1000}
 
 # SQLAlchemy Engine with Connection Pooling
 engine = create_engine(
@@ -33,6 +36,19 @@ engine = create_engine(
     pool_recycle=pool_recycle,
 )
 
+if is_sqlite:
+    @event.listens_for(engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        """
+        WAL lets readers proceed while the writer commits, and synchronous=NORMAL
+        only fsyncs at checkpoints, which is safe under WAL and spares the SD card.
+        """
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA busy_timeout={sqlite_busy_timeout}")
+        cursor.close()
+
 db_session = scoped_session(sessionmaker(autocommit=False,
                                          autoflush=False,
                                          bind=engine))
@@ -47,3 +63,25 @@ def init_db():
     # Import all models to ensure they are registered before table creation
     # Example: from yourapplication.models import SomeModel
     Base.metadata.create_all(bind=engine)
+
+    # create_all skips tables that already exist, so add columns and indexes introduced since
+    inspector = inspect(engine)
+    for table in Base.metadata.sorted_tables:
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing:
+                add_column(table, column)
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+
+def add_column(table, column):
+    """
+    Add a nullable column to an existing table, filling existing rows from the
+    SQL expression in column.info["backfill"] when there is one.
+    """
+    with engine.begin() as connection:
+        column_type = column.type.compile(dialect=engine.dialect)
+        connection.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+        if "backfill" in column.info:
+            connection.execute(text(f"UPDATE {table.name} SET {column.name} = {column.info['backfill']}"))
+    print(f"✅ Added column {table.name}.{column.name}")
@@ -0,0 +1,217 @@
+import datetime
+from collections import Counter
+from sqlalchemy import delete, insert, update
+from models.models import JobQueue, JobDailyStats
+
+FINISHED_JOB_STATUSES = ("completed", "failed", "unknown_command")
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def list_jobs(session, device_id=None, statuses=None, after_id=None, since=None, limit=DEFAULT_PAGE_SIZE,
+              task_names=None):
+    """
+    Return one page of jobs in id order using keyset pagination.
+
+    `after_id` continues from the last id of the previous page and `since`
+    restricts the page to jobs written (queued, claimed or updated) at or after
+    that time, so polling consumers only ever read a bounded slice of the table. `task_names`
+    limits the page to the jobs one worker can run.
+    """
+    query = session.query(JobQueue)
+    if device_id:
+        query = query.filter(JobQueue.device_id == device_id)
+    if statuses:
+        query = query.filter(JobQueue.status.in_(statuses))
+    if task_names:
+        query = query.filter(JobQueue.task_name.in_(task_names))
+    if after_id is not None:
+        query = query.filter(JobQueue.id > after_id)
+    if since is not None:
+        query = query.filter(JobQueue.updated_at >= since)
+    return query.order_by(JobQueue.id).limit(limit).all()
+
+
+def serialize_job(job):
+    return {
+        "id": job.id,
+        "device_id": job.device_id,
+        "job_name": job.task_name,
+        "status": job.status,
+        "issued_at": job.issued_at.strftime(DATETIME_FORMAT),
+        "completed_at": job.completed_at.strftime(DATETIME_FORMAT) if job.completed_at else None,
+    }
+
+
+def claim_pending_jobs(session, device_id, limit=10, exclude_task_names=None):
+    """
+    Atomically claim up to `limit` of the oldest pending jobs for a device.
+
+    Jobs named in `exclude_task_names` are left pending for the worker that
+    owns them.
+
+    Claimed jobs are switched to `in-progress` and committed before they are
+    returned, so concurrent workers never execute the same job. MySQL uses
+    `SELECT ... FOR UPDATE SKIP LOCKED`; other backends (SQLite) fall back to a
+    compare-and-set UPDATE per candidate row.
+    """
+    query = (
+        session.query(JobQueue)
+        .filter(JobQueue.device_id == device_id, JobQueue.status == "pending")
+    )
+    if exclude_task_names:
+        query = query.filter(JobQueue.task_name.notin_(list(exclude_task_names)))
+    query = query.order_by(JobQueue.issued_at, JobQueue.id).limit(limit)
+
+    if session.get_bind().dialect.name == "mysql":
+        jobs = query.with_for_update(skip_locked=True).all()
+        for job in jobs:
+            job.status = "in-progress"
+        session.commit()
+        return jobs
+
+    claimed_ids = []
+    for (job_id,) in query.with_entities(JobQueue.id).all():
+        result = session.execute(
+            update(JobQueue)
+            .where(JobQueue.id == job_id, JobQueue.status == "pending")
+            .values(status="in-progress")
+        )
+        if result.rowcount == 1:
+            claimed_ids.append(job_id)
+    session.commit()
+    if not claimed_ids:
+        return []
+    return (
+        session.query(JobQueue)
+        .filter(JobQueue.id.in_(claimed_ids))
+        .order_by(JobQueue.issued_at, JobQueue.id)
+        .all()
+    )
+
+
+def requeue_in_progress_jobs(session, device_id):
+    """
+    Return jobs left `in-progress` by a worker that died mid-batch to `pending`.
+    """
+    result = session.execute(
+        update(JobQueue)
+        .where(JobQueue.device_id == device_id, JobQueue.status == "in-progress")
+        .values(status="pending")
+    )
+    session.commit()
+    return result.rowcount
+
+
+def enqueue_jobs(session, device_id, task_names):
+    """
+    Insert one pending job per task name in a single transaction.
+
+    The rows go through one executemany INSERT instead of a flush per object.
+    """
+    session.execute(
+        insert(JobQueue),
+        [{"device_id": device_id, "task_name": task_name, "status": "pending"} for task_name in task_names],
+    )
+    session.commit()
+
+
+def update_job_statuses(session, updates, completed_at=None):
+    """
+    Apply many status transitions in one transaction.
+
+    `updates` maps job id to its new status and `completed_at` optionally
+    maps job id to the time it actually finished. Returns the ids that do
+    not exist; the remaining rows are updated with a single executemany UPDATE.
+    """
+    completed_at = completed_at or {}
+    existing_ids = {
+        job_id for (job_id,) in session.query(JobQueue.id).filter(JobQueue.id.in_(list(updates))).all()
+    }
+    now = datetime.datetime.utcnow()
+    rows = []
+    for job_id in existing_ids:
+        row = {"id": job_id, "status": updates[job_id]}
+        if updates[job_id] in FINISHED_JOB_STATUSES:
+            row["completed_at"] = completed_at.get(job_id, now)
+        rows.append(row)
+    if rows:
+        session.execute(update(JobQueue), rows)
+    session.commit()
+    return sorted(set(updates) - existing_ids)
+
+
+def set_job_status(job, status, completed_at=None):
+    """
+    Update a job's status, stamping `completed_at` when it reaches a final state.
+
+    Pass `completed_at` when the job finished earlier than now, e.g. at an actuator ack.
+    """
+    job.status = status
+    if status in FINISHED_JOB_STATUSES:
+        job.completed_at = completed_at or datetime.datetime.utcnow()
+
+
+def update_job(session, job_id, data, completed_at=None):
+    """
+    Apply an /update-job body to one job and commit. Returns False when the job does not exist.
+
+    A "job_name" in `data` renames the job's task; callers validate it against the command registry.
+    """
+    job = session.query(JobQueue).filter(JobQueue.id == job_id).first()
+    if job is None:
+        return False
+    if "job_name" in data:
+        job.task_name = data["job_name"]
+    if "status" in data:
+        set_job_status(job, data["status"], completed_at)
+    session.commit()
+    return True
+
+
+def parse_completed_at(value):
+    """
+    Parse an optional client-reported completion time (ISO 8601, UTC when naive).
+
+    Returns a naive UTC datetime like the rest of the table, or None. Raises ValueError.
+    """
+    if value is None:
+        return None
+    moment = datetime.datetime.fromisoformat(value)
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return moment
+
+
+def compact_finished_jobs(session, cutoff, batch_size=200):
+    """
+    Roll one batch of finished jobs issued before `cutoff` into per-day counts and delete them.
+
+    Each batch is a short transaction that deletes by primary key, so the
+    live queue is never locked for long. Returns the number of jobs removed.
+    """
+    rows = (
+        session.query(JobQueue.id, JobQueue.device_id, JobQueue.task_name, JobQueue.status, JobQueue.issued_at)
+        .filter(JobQueue.status.in_(FINISHED_JOB_STATUSES), JobQueue.issued_at < cutoff)
+        .order_by(JobQueue.id)
+        .limit(batch_size)
+        .all()
+    )
+    if not rows:
+        return 0
+
+    counts = Counter((row.issued_at.date(), row.device_id, row.task_name, row.status) for row in rows)
+    for (day, device_id, task_name, status), count in counts.items():
+        stats = (
+            session.query(JobDailyStats)
+            .filter_by(day=day, device_id=device_id, task_name=task_name, status=status)
+            .first()
+        )
+        if stats is None:
+            session.add(JobDailyStats(day, device_id, task_name, status, count))
+        else:
+            stats.count += count
+    session.execute(delete(JobQueue).where(JobQueue.id.in_([row.id for row in rows])))
+    session.commit()
+    return len(rows)
@@ -1,39 +1,55 @@
 import serial
+import sys
 import time
 import requests
 import json
+from http_client import get_client
+from serial_protocol import negotiate
+from actuator import ActuatorDriver
+from commands import commands_for_port
 
 # Set up serial communication with Arduino
 ser = serial.Serial('/dev/ttyACM1', 9600, timeout=1)
 
-time.sleep(2)  # Wait for the serial connection to initialize
+# The protocol handshake also waits out the Arduino's reset when the port opens
+actuator = ActuatorDriver(ser, decoder=negotiate(ser))
+actuator.start()
+MOTOR_COMMANDS = commands_for_port("motors")  # Job name -> registry command run by this Arduino
+MOTOR_JOB_NAMES = ",".join(MOTOR_COMMANDS)  # job_name filter, so the API only returns jobs for this Arduino
 
 API_ENDPOINT = "http://0.0.0.0:8082" 
+STREAM_MODE = "--stream" in sys.argv  # Receive jobs pushed over /jobs/stream instead of polling
+STREAM_READ_TIMEOUT = 60  # Seconds without data (the server sends keepalives) before reconnecting
+JOB_BATCH_SIZE = 10  # Pending jobs fetched per poll and reported back in one request
+http = get_client()  # Keep-alive connection to the device API
 
-# Function to get jobs from the queue
-def get_job():
-    response = requests.get(f"{API_ENDPOINT}/get-jobs")  # Assuming a GET request to fetch jobs
-    
+# Last /get-jobs response, revalidated with If-None-Match so an unchanged queue costs a 304
+jobs_cache = {"etag": None, "jobs": []}
+
+# Function to get pending jobs from the queue
+def get_jobs():
     try:
-        response = requests.get(f"{API_ENDPOINT}/get-jobs")  # Assuming a GET request to fetch jobs
+        headers = {"If-None-Match": jobs_cache["etag"]} if jobs_cache["etag"] else {}
+        response = http.get(f"{API_ENDPOINT}/get-jobs", params={"status": "pending", "job_name": MOTOR_JOB_NAMES, "limit": JOB_BATCH_SIZE}, headers=headers)
         if response.status_code == 200:
-            job_data = response.json()
-            for job in job_data:
-                if job['status'] != "completed":
-
-                    return job
+            jobs_cache["etag"] = response.headers.get("ETag")
+            jobs_cache["jobs"] = response.json()
+        if response.status_code in (200, 304):
+            return jobs_cache["jobs"]
     except requests.exceptions.RequestException as e:
-        print(f"Error fetching job: {e}")
-    return None
+        print(f"Error fetching jobs: {e}")
+    return []
 
 # Function to report job completion to the API
-def report_job_completion(job_id, status):
+def report_job_completion(job_id, status, completed_at=None):
     try:
         payload = {
             "status": status
         }
+        if completed_at:
+            payload["completed_at"] = completed_at.isoformat()
         headers = {'Content-Type': 'application/json'}
-        response = requests.put(f"{API_ENDPOINT}/update-job/{job_id}", data=json.dumps(payload), headers=headers)  # Assuming a PUT request to report completion
+        response = http.put(f"{API_ENDPOINT}/update-job/{job_id}", data=json.dumps(payload), headers=headers)  # Assuming a PUT request to report completion
         if response.status_code == 200:
             print(f"Successfully reported job {job_id} as {status}")
         else:
@@ -41,32 +57,74 @@ def report_job_completion(job_id, status):
     except requests.exceptions.RequestException as e:
         print(f"Error reporting job: {e}")
 
+# Function to report many job results to the API in one request
+def report_jobs_completion(results):
+    try:
+        payload = [{"id": job_id, "status": status, "completed_at": completed_at.isoformat() if completed_at else None}
+                   for job_id, status, completed_at in results]
+        headers = {'Content-Type': 'application/json'}
+        response = http.put(f"{API_ENDPOINT}/update-jobs", data=json.dumps(payload), headers=headers)
+        if response.status_code == 200:
+            print(f"Successfully reported {len(results)} jobs")
+        else:
+            print(f"Failed to report {len(results)} jobs. Status code: {response.status_code}")
+    except requests.exceptions.RequestException as e:
+        print(f"Error reporting jobs: {e}")
+
+# Function to receive jobs pushed by the device API as server-sent events
+def stream_jobs():
+    last_id = 0
+    while True:
+        try:
+            with http.get(f"{API_ENDPOINT}/jobs/stream", params={"after_id": last_id, "job_name": MOTOR_JOB_NAMES}, stream=True,
+                          timeout=(5, STREAM_READ_TIMEOUT)) as response:
+                data = []
+                for line in response.iter_lines(decode_unicode=True):
+                    if line.startswith("data:"):
+                        data.append(line[5:].strip())
+                    elif line == "" and data:
+                        job = json.loads("\n".join(data))
+                        data = []
+                        last_id = job['id']
+                        yield job
+        except requests.exceptions.RequestException as e:
+            print(f"Job stream interrupted: {e}")
+        time.sleep(1)  # Wait before reconnecting
+
+# Function to drive the motors for a batch of jobs, yielding (job id, status, completed_at) in order.
+# Commands are pipelined and each one finishes on the Arduino's ack (or its timeout).
+def execute_jobs(jobs):
+    commands = [MOTOR_COMMANDS.get(job['job_name']) for job in jobs]
+    results = actuator.execute(command for command in commands if command)
+    for job, command in zip(jobs, commands):
+        if command is None:
+            print(f"Unknown command: {job['job_name']}")
+            yield job['id'], "unknown_command", None
+            continue
+        result = next(results)
+        latency = f" in {result.latency * 1000:.0f} ms" if result.outcome == "acked" else ""
+        print(f"{job['job_name']}: {result.outcome}{latency}")
+        yield job['id'], "completed" if result.ok else "failed", result.completed_at
+
 print("Waiting for jobs in the queue...")
 
 try:
-    while True:
-        job = get_job()
+    if STREAM_MODE:
+        for job in stream_jobs():
+            print(job)
+            for job_id, status, completed_at in execute_jobs([job]):
+                report_job_completion(job_id, status, completed_at)
+    else:
+        while True:
+            jobs = get_jobs()
 
-        print(job)
-        if job:
-            command = job['job_name']
-            job_id = job['id']
-            if command == 'extend_motors':
-                ser.write(b'o')
-                print("Extending motors...")
-            elif command == 'retract_motors':
-                ser.write(b'c')
-                print("Retracting motors...")
+            print(jobs)
+            if jobs:
+                report_jobs_completion(list(execute_jobs(jobs)))
             else:
-                print(f"Unknown command: {command}")
-                report_job_completion(job_id, "unknown_command")
-                continue
-
-            time.sleep(0.5)  # Debounce delay
-            report_job_completion(job_id, "completed")
-        else:
-            time.sleep(1)  # Wait before checking for new jobs again
+                time.sleep(1)  # Wait before checking for new jobs again
 except KeyboardInterrupt:
     print("Program terminated.")
 finally:
+    actuator.stop()
     ser.close()
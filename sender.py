@@ -1,42 +1,12 @@
 import asyncio
-import cv2
-from aiortc import RTCPeerConnection, RTCSessionDescription, VideoStreamTrack
+from aiortc import RTCPeerConnection, RTCSessionDescription
 from aiortc.contrib.signaling import TcpSocketSignaling
-from av import VideoFrame
-import fractions
-from datetime import datetime
-
-class CustomVideoStreamTrack(VideoStreamTrack):
-    def __init__(self, camera_id):
-        super().__init__()
-        self.cap = cv2.VideoCapture("/dev/video0", cv2.CAP_V4L2)
-        self.frame_count = 0
-
-    async def recv(self):
-        self.frame_count += 1
-        print(f"Sending frame {self.frame_count}")
-        ret, frame = self.cap.read()
-        if not ret:
-            print("Failed to read frame from camera")
-            return None
-        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        video_frame = VideoFrame.from_ndarray(frame, format="rgb24")
-        video_frame.pts = self.frame_count
-        video_frame.time_base = fractions.Fraction(1, 30)  # Use fractions for time_base
-        # Add timestamp to the frame
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]  # Current time with milliseconds
-        cv2.putText(frame, timestamp, (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2, cv2.LINE_AA)
-
-        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        video_frame = VideoFrame.from_ndarray(frame, format="rgb24")
-        video_frame.pts = self.frame_count
-        video_frame.time_base = fractions.Fraction(1, 30)  # Use fractions for time_base
-        return video_frame
+from video_tracks import CameraVideoTrack
 
 async def setup_webrtc_and_run(ip_address, port, camera_id):
     signaling = TcpSocketSignaling(ip_address, port)
     pc = RTCPeerConnection()
-    video_sender = CustomVideoStreamTrack(camera_id)
+    video_sender = CameraVideoTrack(overlay_timestamp=True)
     pc.addTrack(video_sender)
 
     try:
@@ -0,0 +1,138 @@
+import time
+import warnings
+import numpy as np
+
+METRICS = ("temperature", "turbidity", "ph_level", "hydrogen_sulfide_level")
+AGGREGATION_WINDOW_SIZE = 512  # Readings kept per metric for the rolling baseline
+EWMA_ALPHA = 0.2  # Weight of the newest reading in the exponentially weighted moving average
+DEADBANDS = {  # A reading further than this from the last reported value is reported at once
+    "temperature": 0.5,
+    "turbidity": 1.0,
+    "ph_level": 0.2,
+    "hydrogen_sulfide_level": 2.0,
+}
+SPIKE_Z_SCORE = 4.0  # Standard deviations from the rolling mean that flag a reading as a spike
+SPIKE_MIN_SAMPLES = 10  # Readings needed in the window before spikes are flagged
+
+
+class SensorAggregator:
+    """Summarises raw sensor readings into rolling-window statistics.
+
+    Readings are stored in a fixed numpy ring buffer with one column per
+    metric, and every statistic is computed over whole columns at once.
+    `add()` returns a reason when a reading must be reported immediately:
+    "spike" when a metric sits more than `spike_z` standard deviations from
+    its rolling mean, or "deadband" when it moved further than the metric's
+    deadband from the last reported value. `summary()` builds the payload for
+    the readings seen since the previous report.
+    """
+
+    def __init__(self, window_size=AGGREGATION_WINDOW_SIZE, deadbands=DEADBANDS, alpha=EWMA_ALPHA,
+                 spike_z=SPIKE_Z_SCORE, metrics=METRICS):
+        self.metrics = metrics
+        self.window_size = window_size
+        self.alpha = alpha
+        self.spike_z = spike_z
+        self.deadbands = np.array([deadbands.get(metric, np.inf) for metric in metrics], dtype=float)
+        self._values = np.full((window_size, len(metrics)), np.nan)
+        self._count = 0  # Readings added in total; the next row written is _count % window_size
+        self._pending = 0  # Readings since the last summary
+        self._ewma = np.full(len(metrics), np.nan)
+        self._last_reported = np.full(len(metrics), np.nan)
+        self._latest = np.full(len(metrics), np.nan)
+        self._flags = []
+        self._window_started = None
+
+    def _rows(self, count):
+        """Returns the newest `count` rows of the ring buffer, oldest first."""
+        count = min(count, self._count, self.window_size)
+        end = self._count % self.window_size
+        indices = np.arange(end - count, end) % self.window_size
+        return self._values[indices]
+
+    def add(self, reading, received_at=None):
+        """Adds one raw reading. Returns "spike", "deadband" or None."""
+        try:
+            values = np.array([reading.get(metric, np.nan) for metric in self.metrics], dtype=float)
+        except (AttributeError, TypeError, ValueError):
+            print(f"❌ Error: Unusable reading from serial - {reading}")
+            return None
+        present = ~np.isnan(values)
+        if not present.any():
+            return None
+
+        flagged = np.zeros(len(self.metrics), dtype=bool)
+        baseline = self._rows(self.window_size)
+        if len(baseline) >= SPIKE_MIN_SAMPLES:
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore", RuntimeWarning)  # Columns that are still all NaN
+                mean = np.nanmean(baseline, axis=0)
+                std = np.nanstd(baseline, axis=0)
+            z_scores = np.divide(np.abs(values - mean), std, out=np.zeros_like(values), where=std > 0)
+            flagged = present & (z_scores > self.spike_z)
+            for index in np.flatnonzero(flagged):
+                self._flags.append({
+                    "metric": self.metrics[index],
+                    "value": float(values[index]),
+                    "z_score": round(float(z_scores[index]), 2),
+                    "at": received_at or time.time(),
+                })
+
+        self._values[self._count % self.window_size] = values
+        self._count += 1
+        self._pending += 1
+        if self._window_started is None:
+            self._window_started = received_at or time.time()
+        self._latest = np.where(present, values, self._latest)
+        self._ewma = np.where(np.isnan(self._ewma), values,
+                              np.where(present, self.alpha * values + (1 - self.alpha) * self._ewma, self._ewma))
+
+        if flagged.any():
+            return "spike"
+        moved = present & (np.isnan(self._last_reported) | (np.abs(values - self._last_reported) > self.deadbands))
+        if moved.any():
+            return "deadband"
+        return None
+
+    def summary(self, reason="interval"):
+        """Builds the report for the readings since the previous one, or None if there were none.
+
+        Metric fields hold the window means for "interval" reports and the
+        triggering reading for "spike" and "deadband" reports, so alarms reach
+        the terminal undiluted. Per-metric min/max/mean/EWMA go under "stats".
+        """
+        if self._pending == 0:
+            return None
+        window = self._rows(self._pending)
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)
+            mins = np.nanmin(window, axis=0)
+            maxs = np.nanmax(window, axis=0)
+            means = np.nanmean(window, axis=0)
+        counts = np.count_nonzero(~np.isnan(window), axis=0)
+        reported = means if reason == "interval" else self._latest
+
+        payload = {}
+        stats = {}
+        for index, metric in enumerate(self.metrics):
+            if counts[index] == 0:
+                continue
+            payload[metric] = round(float(reported[index]), 3)
+            stats[metric] = {
+                "min": round(float(mins[index]), 3),
+                "max": round(float(maxs[index]), 3),
+                "mean": round(float(means[index]), 3),
+                "ewma": round(float(self._ewma[index]), 3),
+                "count": int(counts[index]),
+            }
+        payload["stats"] = stats
+        payload["flags"] = self._flags
+        payload["reason"] = reason
+        payload["window_start"] = self._window_started
+        payload["window_end"] = time.time()
+
+        self._last_reported = np.where(np.isnan(reported), self._last_reported, reported)
+        self._pending = 0
+        self._flags = []
+        self._window_started = None
+        return payload
@@ -1,6 +1,7 @@
 import serial
 import requests
-import json
+from http_client import get_client
+from serial_protocol import negotiate, FRAME_READING
 
 # Configuration
 SERIAL_PORT = "/dev/ttyACM0"  # Replace with your Arduino's COM port (e.g., "COM3" for Windows, "/dev/ttyUSB0" for Linux)
@@ -8,32 +9,31 @@ BAUD_RATE = 9600      # Must match the Arduino Serial.begin() baud rate
 API_URL = "https://amanrest-925084270691.asia-east2.run.app/set_water_parameters"
 
 def main():
+    http = get_client()  # Reuses the TLS connection to Cloud Run across readings
     try:
         # Initialize the serial connection
         print(f"Connecting to Arduino on {SERIAL_PORT} at {BAUD_RATE} baud...")
         ser = serial.Serial(SERIAL_PORT, BAUD_RATE, timeout=1)
         print("Connected to Arduino!")
+        decoder = negotiate(ser)  # Binary frames when the firmware supports them, JSON lines otherwise
 
         while True:
-            # Read line from Serial
-            if ser.in_waiting > 0:
-                raw_line = ser.readline().decode('utf-8').strip()
+            # Read whatever has arrived and decode every complete reading
+            for frame in decoder.feed(ser.read(ser.in_waiting or 1)):
+                if frame.type != FRAME_READING:
+                    continue
+                sensor_data = frame.payload
                 print("---------")
-                print(raw_line)
+                print(sensor_data)
                 print("---------")
                 try:
-                    # Parse JSON data from Arduino
-                    sensor_data = json.loads(raw_line)
-
                     # Send POST request to the API
                     headers = {'Content-Type': 'application/json'}
-                    response = requests.post(API_URL, json=sensor_data, headers=headers)
+                    response = http.post(API_URL, json=sensor_data, headers=headers)
 
                     # Log the API response
                     print(f"Sent data to server: {sensor_data}")
                     print(f"Server Response: {response.status_code} - {response.text}")
-                except json.JSONDecodeError:
-                    print(f"Error: Could not parse JSON: {raw_line}")
                 except requests.RequestException as e:
                     print(f"Error: Failed to send data to server: {e}")
     except serial.SerialException as e:
@@ -0,0 +1,206 @@
+"""Serial wire formats spoken by the Arduinos: line-delimited JSON and compact binary frames.
+
+Binary frame layout (little-endian):
+
+    sync   2 bytes  0xA5 0x5A
+    type   u8       FRAME_READING, FRAME_ACK or FRAME_HELLO
+    length u8       payload length in bytes
+    seq    u16      sender's sequence number, wraps at 65536
+    payload         `length` bytes, fixed per type (see PAYLOADS)
+    crc    u16      CRC-CCITT (binascii.crc_hqx, initial 0xFFFF) over type..payload
+
+A reading is 24 bytes on the wire instead of ~100 bytes of JSON, about
+25 ms at 9600 baud. The host asks for binary framing by writing
+HANDSHAKE_REQUEST after opening the port. Firmware that supports it
+answers with a HELLO frame carrying PROTOCOL_VERSION and switches to
+binary. Older firmware ignores the request and keeps sending JSON.
+"""
+import binascii
+import collections
+import json
+import struct
+import time
+import numpy as np
+
+SYNC = b"\xa5\x5a"
+PROTOCOL_VERSION = 1
+HANDSHAKE_REQUEST = b"?BIN1\n"  # Contains none of the actuator command bytes, so it is safe on either board
+HANDSHAKE_TIMEOUT = 3  # Seconds to wait for a HELLO; covers the Arduino's reset when the port opens
+HANDSHAKE_RETRY_INTERVAL = 1  # Seconds between handshake requests
+MAX_LINE_LENGTH = 4096  # Partial JSON lines longer than this are discarded as line noise
+
+FRAME_READING = 0x01
+FRAME_ACK = 0x02
+FRAME_HELLO = 0x03
+
+READING_METRICS = ("temperature", "turbidity", "ph_level", "hydrogen_sulfide_level")
+PAYLOADS = {
+    FRAME_READING: struct.Struct("<4f"),  # READING_METRICS as float32
+    FRAME_ACK: struct.Struct("<cB"),  # command byte, status (0 = done)
+    FRAME_HELLO: struct.Struct("<B"),  # protocol version
+}
+HEADER = struct.Struct("<2sBBH")
+CRC = struct.Struct("<H")
+CRC_INIT = 0xFFFF
+
+Frame = collections.namedtuple("Frame", ["type", "seq", "payload"])
+
+
+def _crc(data):
+    return binascii.crc_hqx(data, CRC_INIT)
+
+
+def encode_frame(frame_type, seq, payload):
+    """Builds one binary frame from already packed payload bytes."""
+    body = HEADER.pack(SYNC, frame_type, len(payload), seq & 0xFFFF)[2:] + payload
+    return SYNC + body + CRC.pack(_crc(body))
+
+
+def encode_reading(seq, reading):
+    values = [float(reading.get(metric, float("nan"))) for metric in READING_METRICS]
+    return encode_frame(FRAME_READING, seq, PAYLOADS[FRAME_READING].pack(*values))
+
+
+def encode_ack(seq, command, status=0):
+    return encode_frame(FRAME_ACK, seq, PAYLOADS[FRAME_ACK].pack(command, status))
+
+
+def encode_hello(seq=0):
+    return encode_frame(FRAME_HELLO, seq, PAYLOADS[FRAME_HELLO].pack(PROTOCOL_VERSION))
+
+
+class JsonLineDecoder:
+    """Decodes line-delimited JSON. Every valid line becomes a FRAME_READING without a sequence number."""
+
+    name = "json"
+
+    def __init__(self):
+        self._partial = bytearray()
+
+    def feed(self, chunk):
+        """Returns the frames completed by `chunk`."""
+        self._partial.extend(chunk)
+        *lines, rest = self._partial.split(b"\n")
+        self._partial = bytearray(rest) if len(rest) <= MAX_LINE_LENGTH else bytearray()
+        frames = []
+        for raw in lines:
+            raw_line = raw.decode("utf-8", errors="replace").strip()
+            if not raw_line:
+                continue
+            try:
+                frames.append(Frame(FRAME_READING, None, json.loads(raw_line)))
+            except json.JSONDecodeError:
+                print(f"❌ Error: Invalid JSON from serial - {raw_line}")
+        return frames
+
+
+class BinaryFrameDecoder:
+    """Decodes binary frames, resynchronising on the sync bytes after line noise.
+
+    Frames with a bad CRC, unknown type or wrong length are dropped and
+    counted in `crc_errors`. Gaps in the sequence numbers of reading frames
+    are counted in `lost`. Runs of reading frames are unpacked together with
+    `numpy.frombuffer`.
+    """
+
+    name = "binary"
+    READING_DTYPE = np.dtype([("sync", "S2"), ("type", "u1"), ("length", "u1"), ("seq", "<u2"),
+                              ("values", "<f4", len(READING_METRICS)), ("crc", "<u2")])
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._last_seq = None  # Of the last reading frame
+        self.crc_errors = 0
+        self.lost = 0
+
+    def feed(self, chunk):
+        """Returns the frames completed by `chunk`."""
+        self._buffer.extend(chunk)
+        frames = []
+        while True:
+            start = self._buffer.find(SYNC)
+            if start < 0:
+                del self._buffer[:-1]  # Keep a trailing first sync byte
+                break
+            del self._buffer[:start]
+            if self._buffer[2:3] == bytes([FRAME_READING]) and self._decode_readings(frames):
+                continue
+            if len(self._buffer) < HEADER.size:
+                break
+            _, frame_type, length, seq = HEADER.unpack_from(self._buffer)
+            layout = PAYLOADS.get(frame_type)
+            size = HEADER.size + length + CRC.size
+            # A sync pair inside noise reads as a bogus header; drop it now rather than wait for `length` bytes
+            valid = layout is not None and layout.size == length
+            if valid and len(self._buffer) < size:
+                break
+            body = bytes(self._buffer[2:HEADER.size + length])
+            if not valid or CRC.unpack_from(self._buffer, HEADER.size + length)[0] != _crc(body):
+                self.crc_errors += 1
+                del self._buffer[:2]  # Resynchronise on the next sync bytes
+                continue
+            frames.append(self._frame(frame_type, seq, layout.unpack_from(body, HEADER.size - 2)))
+            del self._buffer[:size]
+        return frames
+
+    def _decode_readings(self, frames):
+        """Vectorised path for a run of complete reading frames at the front of the buffer."""
+        count = len(self._buffer) // self.READING_DTYPE.itemsize
+        if count == 0:
+            return False
+        records = np.frombuffer(bytes(self._buffer[:count * self.READING_DTYPE.itemsize]), dtype=self.READING_DTYPE)
+        good = (records["sync"] == SYNC) & (records["type"] == FRAME_READING) \
+            & (records["length"] == PAYLOADS[FRAME_READING].size)
+        run = int(np.argmin(good)) if not good.all() else count  # Frames before the first non-reading
+        if run == 0:
+            return False
+        decoded = 0
+        for record in records[:run]:
+            raw = record.tobytes()
+            if CRC.unpack_from(raw, len(raw) - CRC.size)[0] != _crc(raw[2:-CRC.size]):
+                break  # Let the general path resynchronise from here
+            frames.append(self._frame(FRAME_READING, int(record["seq"]), record["values"].tolist()))
+            decoded += 1
+        del self._buffer[:decoded * self.READING_DTYPE.itemsize]
+        return decoded > 0
+
+    def _frame(self, frame_type, seq, fields):
+        if frame_type == FRAME_READING:
+            if self._last_seq is not None:
+                self.lost += (seq - self._last_seq - 1) & 0xFFFF
+            self._last_seq = seq
+            payload = {metric: round(value, 4) for metric, value in zip(READING_METRICS, fields)
+                       if value == value}  # NaN marks a sensor without a value
+        elif frame_type == FRAME_ACK:
+            payload = {"command": fields[0].decode("ascii", errors="replace"), "status": fields[1]}
+        else:
+            payload = {"version": fields[0]}
+        return Frame(frame_type, seq, payload)
+
+
+def negotiate(serial_conn, timeout=HANDSHAKE_TIMEOUT):
+    """Asks the firmware for binary framing and returns the decoder to use on `serial_conn`.
+
+    Falls back to `JsonLineDecoder` when no HELLO arrives within `timeout`.
+    Bytes read while negotiating are discarded. Reads block for at most
+    HANDSHAKE_RETRY_INTERVAL whatever the port's own timeout, which is
+    restored afterwards.
+    """
+    decoder = BinaryFrameDecoder()
+    deadline = time.monotonic() + timeout
+    next_request = 0
+    port_timeout = serial_conn.timeout
+    serial_conn.timeout = min(port_timeout or HANDSHAKE_RETRY_INTERVAL, HANDSHAKE_RETRY_INTERVAL)
+    try:
+        while time.monotonic() < deadline:
+            if time.monotonic() >= next_request:
+                serial_conn.write(HANDSHAKE_REQUEST)
+                next_request = time.monotonic() + HANDSHAKE_RETRY_INTERVAL
+            for frame in decoder.feed(serial_conn.read(serial_conn.in_waiting or 1)):
+                if frame.type == FRAME_HELLO and frame.payload["version"] == PROTOCOL_VERSION:
+                    print(f"✅ Binary serial protocol v{PROTOCOL_VERSION} on {serial_conn.port}")
+                    return BinaryFrameDecoder()
+    finally:
+        serial_conn.timeout = port_timeout
+    print(f"⚠️ No binary protocol on {serial_conn.port}, using line-delimited JSON.")
+    return JsonLineDecoder()
@@ -0,0 +1,93 @@
+import collections
+import threading
+import time
+import serial
+from serial_protocol import JsonLineDecoder, FRAME_READING
+
+SERIAL_READ_TIMEOUT = 0.5  # Seconds a read may block waiting for the first byte
+RING_BUFFER_SIZE = 1024  # Parsed readings kept in memory
+
+
+class SerialIngestor:
+    """Drains a sensor serial port on a dedicated thread.
+
+    Bytes go through `decoder` (line-delimited JSON unless a binary decoder
+    was negotiated, see serial_protocol.py) and every decoded reading is
+    pushed into a bounded ring buffer as soon as it arrives, so fast sensor firmware never backs up in the OS
+    buffer. Consumers read the latest reading or every reading since a
+    sequence number at their own pace, independent of the sampling rate.
+    """
+
+    def __init__(self, serial_conn, buffer_size=RING_BUFFER_SIZE, read_timeout=SERIAL_READ_TIMEOUT, decoder=None):
+        self.serial_conn = serial_conn
+        self.decoder = decoder or JsonLineDecoder()
+        self.read_timeout = read_timeout
+        self.readings = collections.deque(maxlen=buffer_size)  # (seq, received_at, reading)
+        self._condition = threading.Condition()
+        self._seq = 0
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self.serial_conn.timeout = self.read_timeout
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=2):
+        self._stop_event.set()
+        self.wake()
+        if self._thread:
+            self._thread.join(timeout)
+        self._thread = None
+
+    def wake(self):
+        """Wakes consumers blocked in `wait_for_readings()` so they can re-check whether to stop."""
+        with self._condition:
+            self._condition.notify_all()
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            try:
+                # Block for at most `read_timeout` on the first byte, then take everything buffered.
+                chunk = self.serial_conn.read(self.serial_conn.in_waiting or 1)
+            except serial.SerialException as e:
+                print(f"❌ Error reading serial data: {e}")
+                self._stop_event.wait(1)
+                continue
+            if chunk:
+                self.feed(chunk)
+
+    def feed(self, chunk):
+        """Decodes raw bytes and publishes every complete reading."""
+        for frame in self.decoder.feed(chunk):
+            if frame.type == FRAME_READING:
+                self._publish(frame.payload)
+
+    def _publish(self, reading):
+        with self._condition:
+            self._seq += 1
+            self.readings.append((self._seq, time.time(), reading))
+            self._condition.notify_all()
+
+    def latest(self):
+        """Returns the most recent reading, or None before the first one arrives."""
+        with self._condition:
+            return self.readings[-1][2] if self.readings else None
+
+    def readings_since(self, seq):
+        """Returns buffered (seq, received_at, reading) tuples newer than `seq`."""
+        with self._condition:
+            return [entry for entry in self.readings if entry[0] > seq]
+
+    def wait_for_readings(self, seq, timeout=None):
+        """Like `readings_since()`, but first waits up to `timeout` for a reading newer than `seq`.
+
+        Returns an empty list on timeout or when woken by `wake()`.
+        """
+        with self._condition:
+            if self._seq == seq:
+                self._condition.wait(timeout)
+            return [entry for entry in self.readings if entry[0] > seq]
@@ -0,0 +1,115 @@
+import time
+import pytest
+from serial_protocol import (BinaryFrameDecoder, JsonLineDecoder, negotiate, encode_reading, encode_ack, encode_hello,
+                             FRAME_READING, FRAME_ACK, FRAME_HELLO, HANDSHAKE_REQUEST, SYNC)
+
+READINGS = [
+    {"temperature": 21.5, "turbidity": 3.25, "ph_level": 7.0, "hydrogen_sulfide_level": 0.5},
+    {"temperature": 22.0, "turbidity": 3.5, "ph_level": 6.75, "hydrogen_sulfide_level": 0.25},
+    {"temperature": 22.5, "turbidity": 4.0, "ph_level": 6.5},  # No H2S sensor value
+]
+
+
+class FakeSerial:
+    """Serial port stand-in that answers reads from a byte script."""
+
+    port = "/dev/fake"
+
+    def __init__(self, incoming=b"", reply=b"", timeout=20):
+        self.incoming = bytearray(incoming)
+        self.reply = reply  # Queued after every write
+        self.timeout = timeout
+        self.written = []
+        self.read_timeouts = []
+
+    @property
+    def in_waiting(self):
+        return len(self.incoming)
+
+    def write(self, data):
+        self.written.append(data)
+        self.incoming.extend(self.reply)
+
+    def read(self, size):
+        self.read_timeouts.append(self.timeout)
+        if not self.incoming:
+            time.sleep(0.01)  # A real port would block up to `timeout`
+            return b""
+        data = bytes(self.incoming[:size])
+        del self.incoming[:size]
+        return data
+
+
+def reading_frames(start_seq=1):
+    return [encode_reading(seq, reading) for seq, reading in enumerate(READINGS, start_seq)]
+
+
+def feed_all(decoder, chunks):
+    frames = []
+    for chunk in chunks:
+        frames.extend(decoder.feed(chunk))
+    return frames
+
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 7, 24, 1000])
+def test_binary_frames_split_across_chunks(chunk_size):
+    stream = b"".join(reading_frames()) + encode_ack(4, b"F") + encode_hello(5)
+    decoder = BinaryFrameDecoder()
+    frames = feed_all(decoder, [stream[i:i + chunk_size] for i in range(0, len(stream), chunk_size)])
+
+    assert [frame.type for frame in frames] == [FRAME_READING] * 3 + [FRAME_ACK, FRAME_HELLO]
+    assert [frame.seq for frame in frames] == [1, 2, 3, 4, 5]
+    assert [frame.payload for frame in frames[:3]] == READINGS
+    assert frames[3].payload == {"command": "F", "status": 0}
+    assert decoder.crc_errors == 0 and decoder.lost == 0
+
+
+def test_binary_decoder_resyncs_after_line_noise():
+    frames = reading_frames()
+    noise = b'{"temperature": 2' + SYNC[:1] + b"\x00\xff" + SYNC + b"\x07"  # Boot text and a stray sync
+    decoder = BinaryFrameDecoder()
+    decoded = feed_all(decoder, [noise + frames[0], b"\xa5", frames[1] + noise, frames[2]])
+
+    assert [frame.payload for frame in decoded] == READINGS
+
+
+def test_binary_decoder_drops_frame_with_bad_crc():
+    frames = reading_frames()
+    corrupted = bytearray(frames[1])
+    corrupted[10] ^= 0xFF  # Flip bits in the payload
+    decoder = BinaryFrameDecoder()
+    decoded = decoder.feed(frames[0] + bytes(corrupted) + frames[2] + encode_ack(4, b"B", 1))
+
+    assert [frame.seq for frame in decoded] == [1, 3, 4]
+    assert decoded[-1].payload == {"command": "B", "status": 1}
+    assert decoder.crc_errors == 1
+    assert decoder.lost == 1  # Reading 2 never arrived
+
+
+def test_json_decoder_joins_lines_split_across_chunks():
+    decoder = JsonLineDecoder()
+    frames = feed_all(decoder, [b'{"temperature": 2', b'1.5}\n{"ph_le', b'vel": 7}\n\nnot json\n{"tu'])
+
+    assert [frame.payload for frame in frames] == [{"temperature": 21.5}, {"ph_level": 7}]
+    assert decoder.feed(b'rbidity": 3}\n')[0].payload == {"turbidity": 3}
+
+
+def test_negotiate_falls_back_to_json_without_hello():
+    port = FakeSerial(incoming=b'{"temperature": 21.5}\n' * 3, timeout=20)
+    started = time.monotonic()
+    decoder = negotiate(port, timeout=0.2)
+
+    assert isinstance(decoder, JsonLineDecoder)
+    assert time.monotonic() - started < 2
+    assert port.written[0] == HANDSHAKE_REQUEST
+    assert max(port.read_timeouts) <= 1  # Reads never block for the port's 20 s
+    assert port.timeout == 20
+
+
+def test_negotiate_picks_binary_on_hello():
+    port = FakeSerial(incoming=b'{"temperature": 21.5}\n', reply=encode_hello(), timeout=0.5)
+    decoder = negotiate(port, timeout=2)
+
+    assert isinstance(decoder, BinaryFrameDecoder)
+    assert port.written == [HANDSHAKE_REQUEST]
+    assert port.timeout == 0.5
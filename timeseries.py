@@ -0,0 +1,251 @@
+import datetime
+import glob
+import math
+import os
+import threading
+import time
+import numpy as np
+from sensor_aggregator import METRICS
+
+SEGMENT_ROWS = 65536  # Rows per memory-mapped segment file
+TIERS = (("raw", 0), ("1m", 60), ("1h", 3600))  # (name, bucket seconds); the raw tier keeps every reading
+TIER_RETENTION = {"raw": 7 * 86400, "1m": 90 * 86400, "1h": 5 * 365 * 86400}  # Seconds of history kept per tier
+MAX_POINTS = 2000  # Most buckets a query returns; smaller steps are widened to fit
+DEFAULT_QUERY_RANGE = 86400  # Seconds covered by a query without `from`
+
+
+def _raw_dtype(metrics):
+    return np.dtype([("t", "f8")] + [(metric, "f4") for metric in metrics])
+
+
+def _aggregate_dtype(metrics):
+    fields = [("t", "f8")]
+    for metric in metrics:
+        fields += [(f"{metric}_sum", "f8"), (f"{metric}_min", "f4"), (f"{metric}_max", "f4"), (f"{metric}_count", "u4")]
+    return np.dtype(fields)
+
+
+class _Segment:
+    """One fixed-size .npy file of rows sorted by time, mapped into memory."""
+
+    def __init__(self, path, dtype=None):
+        self.path = path
+        if dtype is None:
+            self.data = np.lib.format.open_memmap(path, mode="r+")
+        else:
+            self.data = np.lib.format.open_memmap(path, mode="w+", dtype=dtype, shape=(SEGMENT_ROWS,))
+            self.data["t"] = np.nan
+        self.count = int(np.count_nonzero(~np.isnan(self.data["t"])))
+
+    @property
+    def full(self):
+        return self.count == len(self.data)
+
+    @property
+    def last_time(self):
+        return self.data["t"][self.count - 1] if self.count else None
+
+    def append(self, row):
+        self.data[self.count] = row
+        self.count += 1
+
+    def slice(self, start, end):
+        """Returns the index range of rows with start <= t < end."""
+        t = self.data["t"][:self.count]
+        lo, hi = np.searchsorted(t, [start, end])
+        return lo, hi
+
+
+class _Tier:
+    """An append-only sequence of segments named `<tier>-<first timestamp in ms>.npy`."""
+
+    def __init__(self, directory, name, dtype, retention):
+        self.directory = directory
+        self.name = name
+        self.dtype = dtype
+        self.retention = retention
+        paths = glob.glob(os.path.join(directory, f"{name}-*.npy"))
+        paths.sort(key=lambda path: int(os.path.basename(path)[len(name) + 1:-4]))
+        self.segments = [_Segment(path) for path in paths]
+
+    def append(self, row):
+        timestamp = row[0]
+        current = self.segments[-1] if self.segments else None
+        if current is not None and current.count and timestamp < current.last_time:
+            return  # The clock stepped back; keep every segment sorted
+        if current is None or current.full:
+            path = os.path.join(self.directory, f"{self.name}-{int(timestamp * 1000)}.npy")
+            self.segments.append(_Segment(path, self.dtype))
+            self.expire(timestamp)
+        self.segments[-1].append(row)
+
+    def expire(self, now):
+        """Deletes closed segments whose newest row is older than the tier's retention."""
+        while len(self.segments) > 1 and self.segments[0].last_time < now - self.retention:
+            segment = self.segments.pop(0)
+            del segment.data
+            os.remove(segment.path)
+
+    def columns(self, fields, start, end):
+        """Returns copies of `fields` for rows with start <= t < end, as one array per field."""
+        pieces = {field: [] for field in fields}
+        for segment in self.segments:
+            if not segment.count or segment.last_time < start or segment.data["t"][0] >= end:
+                continue
+            lo, hi = segment.slice(start, end)
+            for field in fields:
+                pieces[field].append(np.array(segment.data[field][lo:hi]))
+        return [np.concatenate(pieces[field]) if pieces[field] else np.empty(0, self.dtype[field]) for field in fields]
+
+    def flush(self):
+        for segment in self.segments:
+            segment.data.flush()
+
+
+class _Bucket:
+    """Running sum/min/max/count of every metric for one downsampling bucket."""
+
+    def __init__(self, start, size):
+        self.start = start
+        self.sums = np.zeros(size)
+        self.mins = np.full(size, np.nan)
+        self.maxs = np.full(size, np.nan)
+        self.counts = np.zeros(size, dtype=np.uint32)
+
+    def add(self, values, present):
+        self.sums += np.where(present, values, 0)
+        self.mins = np.fmin(self.mins, values)
+        self.maxs = np.fmax(self.maxs, values)
+        self.counts += present
+
+    def row(self):
+        return (self.start, *np.column_stack([self.sums, self.mins, self.maxs, self.counts]).ravel().tolist())
+
+
+class SensorHistory:
+    """On-device sensor history in append-only, memory-mapped segment files.
+
+    Every reading goes into the raw tier and is folded into 1-minute and
+    1-hour buckets, each written to its own tier once the bucket closes.
+    Queries pick the coarsest tier that still resolves the requested step and
+    bucket it with vectorised numpy reductions, so a chart over days of data
+    touches thousands of rows instead of millions. A bucket still open when
+    the process stops is lost from the coarser tiers; the raw tier has it.
+    """
+
+    def __init__(self, directory, metrics=METRICS):
+        self.directory = directory
+        self.metrics = metrics
+        os.makedirs(directory, exist_ok=True)
+        self.tiers = {}
+        for name, bucket in TIERS:
+            dtype = _raw_dtype(metrics) if bucket == 0 else _aggregate_dtype(metrics)
+            self.tiers[name] = _Tier(directory, name, dtype, TIER_RETENTION[name])
+        self._buckets = {}  # Tier name -> _Bucket still being filled
+        self._lock = threading.Lock()
+
+    def append(self, timestamp, reading):
+        """Stores one raw reading received at `timestamp` (epoch seconds)."""
+        try:
+            values = np.array([reading.get(metric, np.nan) for metric in self.metrics], dtype=float)
+        except (AttributeError, TypeError, ValueError):
+            return
+        present = ~np.isnan(values)
+        if not present.any():
+            return
+        with self._lock:
+            self.tiers["raw"].append((timestamp, *values.tolist()))
+            for name, size in TIERS[1:]:
+                bucket_start = timestamp - timestamp % size
+                bucket = self._buckets.get(name)
+                if bucket is not None and bucket.start != bucket_start:
+                    self.tiers[name].append(bucket.row())
+                    bucket = None
+                if bucket is None:
+                    bucket = self._buckets[name] = _Bucket(bucket_start, len(self.metrics))
+                bucket.add(values, present)
+
+    def query(self, metric, start, end, step=None):
+        """Returns `metric` between `start` and `end` (epoch seconds) in buckets of `step` seconds.
+
+        The result is columnar: bucket start times under "t", with matching
+        "mean", "min", "max" and "count" lists. Empty buckets are omitted.
+        `step` is widened so the range fits in MAX_POINTS buckets; the step
+        actually used is returned under "step".
+        """
+        if metric not in self.metrics:
+            raise ValueError(f"Unknown metric {metric}")
+        step = max(step or 1, (end - start) / MAX_POINTS)
+        tier_name, bucket = next((name, size) for name, size in reversed(TIERS) if size <= step)
+        tier = self.tiers[tier_name]
+
+        with self._lock:
+            if bucket == 0:
+                t, values = tier.columns(["t", metric], start, end)
+                counts = (~np.isnan(values)).astype(np.uint32)
+                sums = np.nan_to_num(values).astype(float)
+                mins = maxs = values
+            else:
+                t, sums, mins, maxs, counts = tier.columns(
+                    ["t", f"{metric}_sum", f"{metric}_min", f"{metric}_max", f"{metric}_count"], start, end)
+
+        result = {"metric": metric, "tier": tier_name, "step": step, "t": [], "mean": [], "min": [], "max": [], "count": []}
+        keep = counts > 0
+        if not keep.any():
+            return result
+        t, sums, mins, maxs, counts = t[keep], sums[keep], mins[keep], maxs[keep], counts[keep]
+
+        # Rows are sorted by time, so each output bucket is a contiguous run
+        buckets = ((t - start) // step).astype(np.int64)
+        boundaries = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+        totals = np.add.reduceat(counts.astype(np.int64), boundaries)
+        result["t"] = (start + buckets[boundaries] * step).tolist()
+        result["mean"] = np.round(np.add.reduceat(sums, boundaries) / totals, 3).tolist()
+        result["min"] = np.round(np.fmin.reduceat(mins, boundaries).astype(float), 3).tolist()
+        result["max"] = np.round(np.fmax.reduceat(maxs, boundaries).astype(float), 3).tolist()
+        result["count"] = totals.tolist()
+        return result
+
+    def flush(self):
+        """Writes dirty pages of every segment back to disk."""
+        with self._lock:
+            for tier in self.tiers.values():
+                tier.flush()
+
+
+def _parse_time(value):
+    try:
+        seconds = float(value)
+    except ValueError:
+        pass
+    else:
+        if not math.isfinite(seconds):
+            raise ValueError("from and to must be finite")
+        return seconds
+    try:
+        moment = datetime.datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError("from and to must be epoch seconds or ISO 8601 timestamps")
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=datetime.timezone.utc)  # Naive times are UTC, like /get-jobs
+    return moment.timestamp()
+
+
+def parse_history_query(args, metrics=METRICS):
+    """Reads metric, from, to and step from query parameters. Raises ValueError on invalid input."""
+    metric = args.get("metric")
+    if metric not in metrics:
+        raise ValueError(f"metric must be one of {', '.join(metrics)}")
+    end = _parse_time(args["to"]) if args.get("to") else time.time()
+    start = _parse_time(args["from"]) if args.get("from") else end - DEFAULT_QUERY_RANGE
+    if start >= end:
+        raise ValueError("from must be before to")
+    step = None
+    if args.get("step"):
+        try:
+            step = float(args["step"])
+        except ValueError:
+            raise ValueError("step must be a positive number of seconds")
+        if not (math.isfinite(step) and step > 0):
+            raise ValueError("step must be a positive number of seconds")
+    return metric, start, end, step
@@ -0,0 +1,228 @@
+import asyncio
+import threading
+import time
+from datetime import datetime
+import cv2
+import numpy as np
+from aiortc import VideoStreamTrack
+from av import VideoFrame
+
+CAMERA_DEVICE = "/dev/video0"
+FRAME_WIDTH = 640
+FRAME_HEIGHT = 480
+TIMING_REPORT_INTERVAL = 300  # Frames between per-frame timing summaries
+FRAME_TIMEOUT = 1  # Seconds recv() waits for a new frame before repeating the last one
+
+
+class FrameTimer:
+    """Accumulates per-frame processing time and prints a summary every `report_every` frames."""
+
+    def __init__(self, name, report_every=TIMING_REPORT_INTERVAL):
+        self.name = name
+        self.report_every = report_every
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    @property
+    def average(self):
+        return self.total / self.count if self.count else 0.0
+
+    def record(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        if self.report_every and self.count % self.report_every == 0:
+            print(f"⏱️ {self.name}: {self.count} frames, avg {self.average * 1000:.2f} ms, max {self.max * 1000:.2f} ms")
+
+
+def _resolve(future, result):
+    if not future.done():
+        future.set_result(result)
+
+
+class FrameGrabber:
+    """Reads a V4L2 camera on a background thread and hands the newest frame to asyncio consumers.
+
+    The blocking `cap.read()` never runs on the event loop. Each captured
+    frame replaces the latest-frame slot and resolves the futures of every
+    coroutine waiting in `next_frame()` through `call_soon_threadsafe`.
+    """
+
+    def __init__(self, device=CAMERA_DEVICE, width=FRAME_WIDTH, height=FRAME_HEIGHT):
+        self.device = device
+        self.width = width
+        self.height = height
+        self.cap = None
+        self._lock = threading.Lock()
+        self._frame = None
+        self._seq = 0
+        self._waiters = []  # (loop, future) pairs waiting for the next frame
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self.cap = cv2.VideoCapture(self.device, cv2.CAP_V4L2)
+        self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, self.width)
+        self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, self.height)
+        if not self.cap.isOpened():
+            self.cap.release()
+            self.cap = None
+            raise RuntimeError(f"❌ Failed to open camera {self.device}. Try using /dev/video1")
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=2):
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout)
+        self._thread = None
+        if self.cap:
+            self.cap.release()
+            self.cap = None
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            # A fresh array per frame: consumers may still hold the previous one
+            success, frame = self.cap.read()
+            if not success:
+                print("⚠️ No frame received from the camera")
+                self._stop_event.wait(0.1)
+                continue
+            with self._lock:
+                self._frame = frame
+                self._seq += 1
+                result = (self._seq, frame)
+                waiters, self._waiters = self._waiters, []
+            for loop, future in waiters:
+                loop.call_soon_threadsafe(_resolve, future, result)
+
+    async def next_frame(self, last_seq):
+        """Returns (seq, frame) for the first frame newer than `last_seq`, waiting if necessary."""
+        with self._lock:
+            if self._frame is not None and self._seq != last_seq:
+                return self._seq, self._frame
+            loop = asyncio.get_running_loop()
+            future = loop.create_future()
+            self._waiters.append((loop, future))
+        return await future
+
+
+class SharedCameraSource:
+    """Reference-counted `FrameGrabber` shared by every track that watches one camera.
+
+    The device is opened by the first `acquire()` and released after the
+    last `release()`, so N peers cost one capture and one USB stream. Both
+    block (opening the device, joining the grab thread), so code on the event
+    loop uses `acquire_async()` and `release_async()` instead.
+    """
+
+    def __init__(self, device=CAMERA_DEVICE, width=FRAME_WIDTH, height=FRAME_HEIGHT):
+        self.grabber = FrameGrabber(device, width, height)
+        self._refs = 0
+        self._lock = threading.Lock()
+
+    @property
+    def subscribers(self):
+        return self._refs
+
+    def acquire(self):
+        with self._lock:
+            if self._refs == 0:
+                self.grabber.start()
+                print(f"🎥 Opened camera {self.grabber.device}")
+            self._refs += 1
+            return self.grabber
+
+    def release(self):
+        with self._lock:
+            if self._refs == 0:
+                return
+            self._refs -= 1
+            if self._refs == 0:
+                self.grabber.stop()
+                print(f"🎥 Released camera {self.grabber.device}")
+
+    async def acquire_async(self):
+        return await asyncio.get_running_loop().run_in_executor(None, self.acquire)
+
+    async def release_async(self):
+        await asyncio.get_running_loop().run_in_executor(None, self.release)
+
+
+class CameraVideoTrack(VideoStreamTrack):
+    """WebRTC video track fed from a V4L2 camera.
+
+    Capture runs on a `FrameGrabber` thread, so `recv()` only awaits the next
+    frame and never blocks the event loop. Frames go straight into
+    `av.VideoFrame` as bgr24 with no colour conversion on our side; only the
+    timestamp overlay copies into a preallocated buffer, since the captured
+    frame may be shared. Timestamps come from `next_timestamp()`, which paces
+    the track on the 90 kHz video clock.
+
+    Pass a `SharedCameraSource` to subscribe several tracks to one capture;
+    otherwise the track opens a private one. On the event loop, create
+    tracks with `open()` and end them with `close()`, which open and release
+    the camera in the default executor.
+    """
+
+    def __init__(self, source=None, overlay_timestamp=False, device=CAMERA_DEVICE, width=FRAME_WIDTH, height=FRAME_HEIGHT,
+                 grabber=None):
+        super().__init__()
+        self.shared_source = source or SharedCameraSource(device, width, height)
+        self.source = grabber or self.shared_source.acquire()  # `grabber` is a subscription already acquired by open()
+        self.overlay_timestamp = overlay_timestamp
+        self.timer = FrameTimer("CameraVideoTrack")
+        self._released = False
+        self._release_future = None
+        self._buffer = np.zeros((self.source.height, self.source.width, 3), dtype=np.uint8)
+        self._frame = self._buffer
+        self._seq = 0
+
+    async def recv(self):
+        pts, time_base = await self.next_timestamp()
+
+        try:
+            self._seq, self._frame = await asyncio.wait_for(self.source.next_frame(self._seq), FRAME_TIMEOUT)
+        except asyncio.TimeoutError:
+            print("⚠️ No frame received from the camera, repeating the last one")
+
+        started = time.perf_counter()
+        frame = self._frame
+        if self.overlay_timestamp:
+            if self._buffer.shape != frame.shape:
+                self._buffer = np.empty_like(frame)
+            np.copyto(self._buffer, frame)
+            frame = self._buffer
+            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]  # Current time with milliseconds
+            cv2.putText(frame, timestamp, (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2, cv2.LINE_AA)
+        video_frame = VideoFrame.from_ndarray(frame, format="bgr24")
+        video_frame.pts = pts
+        video_frame.time_base = time_base
+        self.timer.record(time.perf_counter() - started)
+        return video_frame
+
+    @classmethod
+    async def open(cls, source, **kwargs):
+        """Subscribes a new track to `source` without blocking the event loop. Raises RuntimeError without a camera."""
+        return cls(source, grabber=await source.acquire_async(), **kwargs)
+
+    def stop(self):
+        super().stop()
+        if not self._released:
+            self._released = True
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                self.shared_source.release()
+            else:
+                self._release_future = loop.run_in_executor(None, self.shared_source.release)
+
+    async def close(self):
+        """Stops the track and waits until its camera subscription is released."""
+        self.stop()
+        if self._release_future:
+            await self._release_future
@@ -1,40 +1,15 @@
 import asyncio
-import cv2
-import numpy as np
 from aiohttp import web
-from aiortc import RTCPeerConnection, RTCSessionDescription, MediaStreamTrack
-from aiortc.contrib.media import MediaStreamTrack
+from aiortc import RTCPeerConnection, RTCSessionDescription
 import json
 from aiohttp_cors import setup as setup_cors, ResourceOptions
+from video_tracks import CameraVideoTrack, SharedCameraSource
 
 # Store active WebRTC connections
 pcs = set()
 
-class VideoStreamTrack(MediaStreamTrack):
-    """ WebRTC Video StreamTrack from USB webcam on Raspberry Pi """
-    kind = "video"
-
-    def __init__(self):
-        super().__init__()
-
-        # ✅ Use `/dev/video0` for Raspberry Pi's USB webcam
-        self.cap = cv2.VideoCapture("/dev/video0", cv2.CAP_V4L2)
-        self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, 640)  # Set width
-        self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)  # Set height
-
-        if not self.cap.isOpened():
-            raise RuntimeError("❌ Failed to open the USB webcam. Try using /dev/video1")
-
-    async def recv(self):
-        """Capture frames and send via WebRTC"""
-        success, frame = self.cap.read()
-        if not success:
-            print("⚠️ No frame received from the camera")
-            return None
-
-        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        frame = np.ascontiguousarray(frame)
-        return frame
+# Every peer subscribes to this one capture; the device is only open while someone is watching
+camera_source = SharedCameraSource()
 
 async def offer(request):
     """Handle WebRTC offer from the terminal."""
@@ -45,16 +20,23 @@ async def offer(request):
     pcs.add(pc)
 
     # ✅ Ensure that at least one media track is added
-    video_track = VideoStreamTrack()
-    if video_track:
-        pc.addTrack(video_track)  # Attach camera feed
-    else:
-        return web.json_response({"error": "No valid media track found"}, status=400)
+    try:
+        video_track = await CameraVideoTrack.open(camera_source)  # Opens the camera off the event loop
+    except RuntimeError as e:
+        await close_peer(pc)
+        return web.json_response({"error": str(e)}, status=503)
+    pc.addTrack(video_track)  # Attach camera feed
+
+    @pc.on("connectionstatechange")
+    async def on_connectionstatechange():
+        if pc.connectionState in ("failed", "closed"):
+            await close_peer(pc)
 
     await pc.setRemoteDescription(offer)
     
     # ✅ Ensure offer direction is valid before creating an answer
     if not pc.getTransceivers():
+        await close_peer(pc)
         return web.json_response({"error": "No media transceivers available"}, status=400)
 
     answer = await pc.createAnswer()
@@ -69,13 +51,25 @@ async def offer(request):
         "Access-Control-Allow-Headers": "Content-Type",
     })
 
+async def close_peer(pc):
+    """Close a peer connection, drop it from `pcs` and release its camera subscription."""
+    pcs.discard(pc)
+    for sender in pc.getSenders():
+        if sender.track:
+            await sender.track.close()  # Releases the camera off the event loop
+    await pc.close()
+
 async def cleanup():
     """Close all WebRTC peer connections on exit."""
-    for pc in pcs:
-        await pc.close()
+    for pc in list(pcs):
+        await close_peer(pc)
     pcs.clear()
 
+async def on_shutdown(app):
+    await cleanup()
+
 app = web.Application()
+app.on_shutdown.append(on_shutdown)
 app.add_routes([web.post("/offer", offer)])
 
 # ✅ Enable CORS for all routes